@@ -0,0 +1,214 @@
+"""
+出欠・保存まわりの負荷生成ベンチマーク（ネットワークには出ない）。
+
+N ギルド × M メンバーに数年分の出欠履歴を持たせて保存先に書き、読み込み直したうえで
+  - AttendanceView のボタンをまとめて押す（バースト）
+  - 押している間に /attend_list を呼ぶ
+  - 最後に全期間の /attend_export を呼ぶ
+を行い、クリック/秒・押してから応答までの p50/p99・1クリックあたりの書き込みバイト数・
+常駐メモリ（RSS）・一覧と書き出しの時間を表示する。
+保存先は本物の ChannelStore を偽のデータ用チャンネル（bench.fakes.FakeDataChannel）につなぐか、SQLiteStore を使う。
+
+    python -m bench.attendance_load --guilds 5 --members 200 --years 3 --bursts 20 --burst-size 200
+    python -m bench.attendance_load --backend sqlite --out bench/baselines/attendance_load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from bench.fakes import FakeBot, FakeDataChannel, FakeInteraction
+from bench.notification_loop import percentile
+from commands.attendance import AttendanceView, register_attendance_commands
+from utils.attendance_store import STATUSES, AttendanceBook
+from utils.data_manager import DataManager
+from utils.outbox import outbox
+from utils.storage import ChannelStore, SQLiteStore
+
+DATA_CHANNEL_ID = 42
+
+
+def rss_mb():
+    """現在の常駐メモリ（MB）。/proc がなければ最大値で代用する"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_history(members, years, seed):
+    """平日ごとに全メンバーが回答した years 年分の AttendanceBook（たまに遅刻・欠席）"""
+    rng = random.Random(seed)
+    book = AttendanceBook()
+    day = date.today() - timedelta(days=365 * years)
+    while day < date.today():
+        if day.weekday() < 5:
+            d = day.isoformat()
+            for uid in range(members):
+                book.set(d, str(uid), f"user{uid}", rng.choices(STATUSES, (8, 1, 1))[0])
+        day += timedelta(days=1)
+    return book
+
+
+def make_store(args, bot, workdir):
+    if args.backend == "sqlite":
+        return SQLiteStore(os.path.join(workdir, "bench.db"))
+    return ChannelStore(bot, DATA_CHANNEL_ID, cache_dir=os.path.join(workdir, "cache"))
+
+
+async def seed(args, bot, workdir):
+    """履歴を作って保存先に書き込む（書き込み量と時間も返す）"""
+    dm = DataManager(bot, DATA_CHANNEL_ID, save_interval=0, backend=make_store(args, bot, workdir))
+    await dm.load_files()
+    records = 0
+    for g in range(args.guilds):
+        book = synthetic_history(args.members, args.years, args.seed + g)
+        dm.get_guild_data(g)["attendance"] = book
+        records += len(book)
+    t = time.perf_counter()
+    await dm.save_all()
+    await dm.flush()
+    elapsed = time.perf_counter() - t
+    await dm.close()
+    return records, elapsed, dm.backend.last_write_bytes
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="utool-bench-")
+    bot = FakeBot()
+    channel = FakeDataChannel(DATA_CHANNEL_ID, bot.user, latency=args.upload_latency)
+    bot.channels[DATA_CHANNEL_ID] = channel
+
+    rss_start = rss_mb()
+    records, seed_s, seed_bytes = await seed(args, bot, workdir)
+    print(f"📚 履歴 {records} 件を書き込み: {seed_s:.2f}s, {seed_bytes / 1024:.0f}KB")
+
+    # 再起動したつもりで読み込み直す（シャードはギルドが使われたときに読む）
+    dm = DataManager(bot, DATA_CHANNEL_ID, save_interval=args.save_interval, backend=make_store(args, bot, workdir))
+    t = time.perf_counter()
+    await dm.load_files()
+    load_s = time.perf_counter() - t
+    register_attendance_commands(bot, dm)
+    attend_list = bot.tree.get("attend_list")
+    attend_export = bot.tree.get("attend_export")
+
+    today = date.today().isoformat()
+    views = {g: AttendanceView(dm, g, today) for g in range(args.guilds)}
+    rng = random.Random(args.seed)
+    latencies, list_times = [], []
+    bytes_before, sends_before = channel.bytes_sent, channel.sends
+    store_bytes = count_write_bytes(dm.backend)
+    writes_before = dm.stats["writes"]
+
+    async def click(g, uid, status):
+        it = FakeInteraction(uid, g)
+        await views[g].update_attendance(it, status, "✅")
+        latencies.append(it.response.acked_at - it.created)
+
+    async def listing(g):
+        it = FakeInteraction(0, g)
+        await attend_list(it)
+        list_times.append(it.response.acked_at - it.created)
+
+    started = time.perf_counter()
+    busy = 0.0
+    for _ in range(args.bursts):
+        batch = [(rng.randrange(args.guilds), rng.randrange(args.members), rng.choice(STATUSES)) for _ in range(args.burst_size)]
+        t = time.perf_counter()
+        await asyncio.gather(*(click(*c) for c in batch),
+                             *(listing(rng.randrange(args.guilds)) for _ in range(args.lists)))
+        busy += time.perf_counter() - t
+        await asyncio.sleep(args.burst_gap)
+    await dm.flush()
+    elapsed = time.perf_counter() - started
+    clicks = args.bursts * args.burst_size
+    # チャンネルはマニフェストの編集も含めて実際に送ったバイト数、SQLite は書き込んだ行の分
+    written = channel.bytes_sent - bytes_before if args.backend == "channel" else store_bytes[0]
+    rss_after_clicks = rss_mb()
+
+    export_times, export_bytes = [], 0
+    for g in range(args.guilds):
+        it = FakeInteraction(0, g)
+        t = time.perf_counter()
+        await attend_export(it)
+        export_times.append(time.perf_counter() - t)
+        export_bytes += sum(n for _, n in it.files)
+    await dm.close()
+    await outbox.close()
+
+    result = {
+        "backend": args.backend, "guilds": args.guilds, "members": args.members, "years": args.years,
+        "history_records": records, "clicks": clicks,
+        "seed_s": round(seed_s, 4), "seed_bytes": seed_bytes, "load_s": round(load_s, 4),
+        "clicks_per_s": round(clicks / elapsed, 1),
+        "clicks_per_s_burst": round(clicks / busy, 1) if busy else None,
+        "ack_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "ack_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "list_p50_ms": round(percentile(list_times, 50) * 1000, 3),
+        "writes": dm.stats["writes"] - writes_before,
+        "uploads": channel.sends - sends_before if args.backend == "channel" else None,
+        "bytes_per_click": round(written / clicks, 1) if clicks else 0,
+        "export_p50_s": round(percentile(export_times, 50), 4),
+        "export_bytes": export_bytes,
+        "rss_start_mb": round(rss_start, 1),
+        "rss_after_clicks_mb": round(rss_after_clicks, 1),
+        "rss_peak_mb": round(peak_rss_mb(), 1),
+    }
+    return result
+
+
+def count_write_bytes(store):
+    """保存先の書き込みごとに last_write_bytes を足し上げる（合計は返したリストの [0] に入る）"""
+    total = [0]
+    for name in ("write_snapshot", "append_journal"):
+        def wrap(fn):
+            async def counted(*args, **kwargs):
+                result = await fn(*args, **kwargs)
+                total[0] += store.last_write_bytes
+                return result
+            return counted
+        setattr(store, name, wrap(getattr(store, name)))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("channel", "sqlite"), default="channel")
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--years", type=float, default=2, help="作っておく履歴の年数")
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--burst-size", type=int, default=200, help="1回のバーストで同時に押す数")
+    parser.add_argument("--burst-gap", type=float, default=0.2, help="バーストの間隔（秒）")
+    parser.add_argument("--lists", type=int, default=2, help="バーストごとに同時に呼ぶ /attend_list の数")
+    parser.add_argument("--save-interval", type=float, default=1.0, help="書き込みをまとめる間隔（本番は30秒）")
+    parser.add_argument("--upload-latency", type=float, default=0.05, help="データ用チャンネルへの送信1回にかかる秒数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="結果を書き出す JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    for k, v in result.items():
+        print(f"  {k:20} {v}")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        report = {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                  "params": vars(args), "result": result}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 {args.out} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
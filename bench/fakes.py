@@ -0,0 +1,326 @@
+"""
+ベンチマーク用の偽物（ネットワークに出ない Google Calendar / Discord の代わり）。
+"""
+import asyncio
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from commands.reminder import GENRES, GoogleCalendarManager
+from utils.storage import StorageBackend
+
+JST = timezone(timedelta(hours=9))
+
+
+# --- Google Calendar ---
+
+def make_events(cid, count, days=7, now=None, seed=0):
+    """cid のカレンダーに count 件の予定を今日から days 日間に散らして作る（終日の予定も混ぜる）"""
+    now = now or datetime.now(JST)
+    base = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    tags = [g["tag"] for g in GENRES.values()]
+    events = []
+    for i in range(count):
+        day = base + timedelta(days=(i * 7 + seed) % days)
+        summary = f"{tags[(i + seed) % len(tags)]} 予定{i} ({cid})"
+        if i % 5 == 4:
+            start = {"date": day.strftime('%Y-%m-%d')}
+            end = {"date": (day + timedelta(days=1)).strftime('%Y-%m-%d')}
+        else:
+            s = day + timedelta(hours=8 + (i * 3) % 14, minutes=(i * 15) % 60)
+            start = {"dateTime": s.isoformat(), "timeZone": "Asia/Tokyo"}
+            end = {"dateTime": (s + timedelta(hours=1)).isoformat(), "timeZone": "Asia/Tokyo"}
+        events.append({"id": f"{cid}-e{i}", "status": "confirmed", "summary": summary,
+                       "start": start, "end": end, "updated": now.isoformat()})
+    return events
+
+
+class FakeCalendarService:
+    """
+    googleapiclient の service と同じ形（service.events().list(...).execute()）で呼べる偽の Calendar API。
+    execute() は latency 秒ブロックする（本物と同じくワーカースレッドから呼ばれる）
+    """
+    def __init__(self, calendars, latency=0.0, page_size=250):
+        self.calendars = calendars  # calendar_id -> [event, ...]
+        self.latency = latency
+        self.page_size = page_size
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._tokens = itertools.count(1)
+
+    @property
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def events(self):
+        return _Events(self)
+
+    def _execute(self, method, fn):
+        if self.latency: time.sleep(self.latency)
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        return fn()
+
+    def _list(self, calendarId, pageToken=None, syncToken=None, maxResults=None, timeMin=None, **params):
+        if syncToken:
+            # 差分同期: 偽物では変更が起きないので空を返す
+            return {"items": [], "nextSyncToken": f"sync-{next(self._tokens)}"}
+        items = self.calendars.get(calendarId, [])
+        if timeMin:
+            items = [e for e in items if e["end"].get("dateTime", e["end"].get("date")) >= timeMin[:10]]
+        size = min(maxResults or self.page_size, self.page_size)
+        offset = int(pageToken or 0)
+        res = {"items": items[offset:offset + size]}
+        if offset + size < len(items):
+            res["nextPageToken"] = str(offset + size)
+        else:
+            res["nextSyncToken"] = f"sync-{next(self._tokens)}"
+        return res
+
+
+class _Events:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, calendarId, **params):
+        return _Request(self.service, "list", lambda: self.service._list(calendarId, **params))
+
+    def get(self, calendarId, eventId):
+        def find():
+            for e in self.service.calendars.get(calendarId, []):
+                if e["id"] == eventId: return e
+            raise KeyError(eventId)
+        return _Request(self.service, "get", find)
+
+
+class _Request:
+    def __init__(self, service, method, fn):
+        self.service, self.method, self.fn = service, method, fn
+
+    def execute(self):
+        return self.service._execute(self.method, self.fn)
+
+
+class FakeCalendarManager(GoogleCalendarManager):
+    """認証を飛ばして偽の service を使う GoogleCalendarManager（取得処理は本物のまま）"""
+    def __init__(self, service):
+        super().__init__(service)
+
+
+# --- Discord ---
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, channel, kwargs):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.kwargs = kwargs
+
+    async def add_reaction(self, emoji):
+        pass
+
+
+class FakeChannel:
+    """送信に latency 秒かかるテキストチャンネル。送信が終わった時刻を sent に残す"""
+    def __init__(self, channel_id, latency=0.0):
+        self.id = channel_id
+        self.latency = latency
+        self.sent = []  # (perf_counter, kwargs)
+
+    async def send(self, content=None, **kwargs):
+        if self.latency: await asyncio.sleep(self.latency)
+        self.sent.append((time.perf_counter(), kwargs))
+        return FakeMessage(self, kwargs)
+
+
+class FakeAttachment:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+        self.size = len(data)
+
+    async def read(self):
+        return self.data
+
+
+class FakeStoredMessage:
+    """データ用チャンネルに残るメッセージ（本文・添付・ピン留め）"""
+    def __init__(self, channel, message_id, content, attachments):
+        self.channel = channel
+        self.id = message_id
+        self.author = channel.author
+        self.content = content or ""
+        self.attachments = attachments
+        self.pinned = False
+
+    async def edit(self, content=None, **kwargs):
+        await self.channel._delay()
+        self.channel.bytes_sent += len((content or "").encode("utf-8"))
+        self.content = content
+
+    async def pin(self):
+        self.pinned = True
+
+
+class FakeDataChannel:
+    """
+    ChannelStore の保存先になるデータ用チャンネルの代わり（メモリ上に履歴を持つ）。
+    送信・編集1回ごとに latency 秒かかり、送ったバイト数を数える
+    """
+    def __init__(self, channel_id, author, latency=0.0):
+        self.id = channel_id
+        self.author = author
+        self.latency = latency
+        self.messages = {}
+        self._ids = itertools.count(1)
+        self.bytes_sent = 0
+        self.sends = 0
+
+    async def _delay(self):
+        if self.latency: await asyncio.sleep(self.latency)
+
+    async def send(self, content=None, file=None, files=None, **kwargs):
+        await self._delay()
+        attachments = []
+        for f in ([file] if file else []) + list(files or []):
+            data = f.fp.read()
+            f.close()
+            attachments.append(FakeAttachment(f.filename, data))
+        msg = FakeStoredMessage(self, next(self._ids), content, attachments)
+        self.messages[msg.id] = msg
+        self.sends += 1
+        self.bytes_sent += len(msg.content.encode("utf-8")) + sum(a.size for a in attachments)
+        return msg
+
+    async def pins(self):
+        return [m for m in reversed(list(self.messages.values())) if m.pinned]
+
+    async def fetch_message(self, message_id):
+        await self._delay()
+        return self.messages[message_id]
+
+    async def history(self, limit=100):
+        for msg in list(reversed(list(self.messages.values())))[:limit]:
+            yield msg
+
+
+class FakeTree:
+    def __init__(self):
+        self.commands = []
+
+    def add_command(self, command):
+        self.commands.append(command)
+
+    def command(self, name=None, description=None, **kwargs):
+        """@bot.tree.command(...) の代わり。登録した関数は名前で引けるように commands に積む"""
+        def decorator(fn):
+            fn.name = name or fn.__name__
+            self.commands.append(fn)
+            return fn
+        return decorator
+
+    def get(self, name):
+        return next(c for c in self.commands if getattr(c, "name", None) == name)
+
+
+class FakeUser:
+    def __init__(self, user_id, manage_guild=False):
+        self.id = user_id
+        self.display_name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.guild_permissions = type("Permissions", (), {"manage_guild": manage_guild})()
+
+
+class FakeGuild:
+    def __init__(self, guild_id, filesize_limit=8 * 1024 * 1024):
+        self.id = guild_id
+        self.filesize_limit = filesize_limit
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, file=None, files=None, **kwargs):
+        for f in ([file] if file else []) + list(files or []):
+            self.interaction.files.append((f.filename, len(f.fp.read())))
+            f.close()
+        self.interaction.messages.append(content)
+
+
+class FakeResponse:
+    """最初の応答（send_message / defer）の時刻を acked_at に残す"""
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.acked_at = None
+
+    def is_done(self):
+        return self.acked_at is not None
+
+    async def send_message(self, content=None, **kwargs):
+        self.acked_at = time.perf_counter()
+        self.interaction.messages.append(content)
+
+    async def defer(self, **kwargs):
+        self.acked_at = time.perf_counter()
+
+
+class FakeInteraction:
+    """コマンドやボタンの処理に渡す Interaction の代わり"""
+    def __init__(self, user_id, guild_id=None, manage_guild=False):
+        self.user = FakeUser(user_id, manage_guild)
+        self.guild_id = guild_id
+        self.guild = FakeGuild(guild_id) if guild_id is not None else None
+        self.channel_id = None
+        self.created = time.perf_counter()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.messages = []
+        self.files = []  # (ファイル名, バイト数)
+
+
+class FakeBot:
+    """
+    register_*_commands とバックグラウンドループが使う分だけの Bot。
+    is_closed() は呼ばれるたびにループ名ごとの回数を数え、loops[name] 回を超えたら True を返す
+    """
+    def __init__(self, channels=(), loops=None):
+        self.tree = FakeTree()
+        self.channels = {ch.id: ch for ch in channels}
+        self.loops = loops or {}
+        self.ticks = {}  # ループ名 -> [is_closed() が呼ばれた perf_counter, ...]
+        self.guilds = []
+        self.latency = 0.0
+        self.user = FakeUser(0)
+
+    async def wait_until_ready(self):
+        pass
+
+    def is_closed(self):
+        task = asyncio.current_task()
+        name = task.get_coro().__name__ if task else ""
+        ticks = self.ticks.setdefault(name, [])
+        ticks.append(time.perf_counter())
+        limit = self.loops.get(name)
+        return limit is not None and len(ticks) > limit
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def change_presence(self, **kwargs):
+        pass
+
+
+class NullStore(StorageBackend):
+    """何も保存しない保存先"""
+    async def load(self):
+        return None, []
+
+    async def write_snapshot(self, data, dirty=None, load_shard=None):
+        pass
+
+    async def append_journal(self, entries, data):
+        pass
@@ -0,0 +1,76 @@
+"""
+起動時の import 時間の予算チェック（python -X importtime を使う）。
+
+新しいプロセスで `import main` だけを行い（Bot には接続しない）、
+  - main の import にかかった時間（cumulative）が --budget-ms 以下であること
+  - 使うときまで遅らせているモジュール（Flask・requests・google ライブラリ・各コマンド）が読み込まれていないこと
+を確かめ、どちらかを破っていれば終了コード1で失敗する。時間は --runs 回のうち最小を使う。
+
+    python -m bench.import_budget --budget-ms 800
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 起動時に読み込んではいけないモジュール（この名前か、その下のモジュール）
+LAZY_MODULES = ("flask", "werkzeug", "requests", "nest_asyncio", "googleapiclient", "google.oauth2", "commands")
+
+
+def measure():
+    """1回分: {モジュール名: (self_us, cumulative_us, main から直接 import したか)} を返す"""
+    env = dict(os.environ, TOKEN=os.getenv("TOKEN", "x"), DATA_CHANNEL_ID=os.getenv("DATA_CHANNEL_ID", "1"))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import main に失敗しました:\n{proc.stderr[-2000:]}")
+    modules, children = {}, []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line: continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        depth = len(name) - len(name.lstrip())
+        name = name.strip()
+        # 子の行は親より先に出るので、最上位の行が来るまでの1段下の行を覚えておく
+        if depth == 1:
+            direct = name == "main"
+            for child in children:
+                modules[child] = modules[child][:2] + (direct,)
+            children = []
+        elif depth == 3:
+            children.append(name)
+        modules[name] = (int(self_us), int(cumulative), False)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1000")))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="表示する重いモジュールの数")
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    best = min(runs, key=lambda m: m["main"][1])
+    total_ms = best["main"][1] / 1000
+
+    # main から直接 import しているものを重い順に表示する
+    direct = [(name, cum) for name, (s, cum, is_direct) in best.items() if is_direct]
+    for name, cum in sorted(direct, key=lambda x: -x[1])[:args.top]:
+        print(f"  {cum / 1000:8.1f}ms  {name}")
+
+    eager = sorted(name for name in best
+                   if any(name == m or name.startswith(m + ".") for m in LAZY_MODULES))
+    print(f"import main: {total_ms:.1f}ms (予算 {args.budget_ms:.0f}ms, {args.runs} 回の最小)")
+    ok = total_ms <= args.budget_ms and not eager
+    if eager:
+        print(f"❌ 起動時に読み込まれています: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        print(f"❌ 予算を {total_ms - args.budget_ms:.1f}ms 超えています")
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+通知ループのベンチマーク（ネットワークには出ない）。
+
+本物の register_reminder_commands / notification_loop / create_daily_embed を、
+偽の Calendar API（bench.fakes.FakeCalendarService）と偽の Discord チャンネルで動かし、
+ギルド数・ギルドあたりのカレンダー数・カレンダーあたりの予定数を変えながら
+  - ループ1周の時間（1周目は朝の定期連絡と全件同期、2周目以降は差分同期）
+  - 1周あたりの Calendar API 呼び出し回数
+  - 送信の遅れ（その周の開始から送信完了まで）
+  - create_daily_embed 1回の時間
+を測る。結果は JSON に保存でき、--baseline で前回の結果と比べて悪化していれば失敗にする。
+
+    python -m bench.notification_loop --guilds 10,50 --calendars 1,3 --events 20,200 --out bench/baselines/notification_loop.json
+    python -m bench.notification_loop --baseline bench/baselines/notification_loop.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+
+CHANNEL_IDS = itertools.count(1_000_000, 1_000_000)
+
+
+def percentile(values, q):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def morning_clock(real):
+    """notification_loop が朝6時台だと思うように datetime.now() だけを差し替える"""
+    class Morning(real):
+        @classmethod
+        def now(cls, tz=None):
+            return real.now(tz).replace(hour=6, minute=0, second=0, microsecond=0)
+    return Morning
+
+
+class FakeWeather:
+    async def get_forecast(self, location=None):
+        today = datetime.now().strftime('%Y-%m-%d')
+        return {today: "☀️快晴 (20℃/10℃)"}
+
+
+async def run_case(args, guilds, calendars, events):
+    from commands import reminder
+    from utils.data_manager import DataManager
+    from bench.fakes import FakeBot, FakeCalendarManager, FakeCalendarService, FakeChannel, NullStore, make_events
+
+    # 全ギルドが同じカレンダーを見る（--shared）か、ギルドごとに別のカレンダーか
+    def calendar_ids(g):
+        return [f"cal{c}" if args.shared else f"g{g}-cal{c}" for c in range(calendars)]
+
+    all_cids = sorted({cid for g in range(guilds) for cid in calendar_ids(g)})
+    service = FakeCalendarService({cid: make_events(cid, events, seed=i) for i, cid in enumerate(all_cids)},
+                                  latency=args.api_latency)
+    # 送信キューのチャンネルごとの流量制限が前の条件の分を引きずらないよう、チャンネル ID は毎回変える
+    base = next(CHANNEL_IDS)
+    channels = [FakeChannel(base + g, args.send_latency) for g in range(guilds)]
+    bot = FakeBot(channels, loops={"notification_loop": args.ticks, "status_loop": 0})
+
+    dm = DataManager(bot, None, save_interval=3600, backend=NullStore())
+    await dm.load_files()
+    for g in range(guilds):
+        dm.set_reminder(g, enabled=True, channel_id=base + g)
+        for cid in calendar_ids(g):
+            dm.add_calendar_id(g, cid)
+
+    before = set(asyncio.all_tasks())
+    reminder.register_reminder_commands(bot, dm, calendar=FakeCalendarManager(service), interval=args.interval)
+    tasks = set(asyncio.all_tasks()) - before
+    loop_task = next(t for t in tasks if t.get_coro().__name__ == "notification_loop")
+
+    # 1周ごとの API 呼び出し回数は、次の周の頭（is_closed() の呼び出し）で区切って数える
+    calls_at = []
+    real_is_closed = bot.is_closed
+    def is_closed():
+        if asyncio.current_task() is loop_task: calls_at.append(service.total_calls)
+        return real_is_closed()
+    bot.is_closed = is_closed
+
+    await asyncio.wait_for(loop_task, args.timeout)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await dm.close()
+
+    starts = bot.ticks["notification_loop"]
+    ticks = [b - a - args.interval for a, b in zip(starts, starts[1:])]
+    calls = [b - a for a, b in zip(calls_at, calls_at[1:])]
+    # 送信の遅れは、その送信が属する周の開始から測る
+    delays = []
+    for ch in channels:
+        for sent_at, _ in ch.sent:
+            start = max((s for s in starts if s <= sent_at), default=starts[0])
+            delays.append(sent_at - start)
+
+    now = datetime.now(reminder.JST)
+    all_evs = [e for cid in calendar_ids(0) for e in service.calendars[cid]]
+    weather = await FakeWeather().get_forecast()
+    samples = []
+    for _ in range(args.embed_repeat):
+        t = time.perf_counter()
+        reminder.create_daily_embed(now, weather, "雑学", all_evs)
+        samples.append(time.perf_counter() - t)
+
+    steady = ticks[1:] or ticks
+    return {
+        "guilds": guilds, "calendars": calendars, "events": events, "shared": args.shared,
+        "ticks": len(ticks),
+        "first_tick_s": round(ticks[0], 6) if ticks else None,
+        "tick_p50_s": round(percentile(steady, 50), 6),
+        "tick_p99_s": round(percentile(steady, 99), 6),
+        "api_calls_first_tick": calls[0] if calls else 0,
+        "api_calls_per_tick": round(statistics.mean(calls[1:]), 3) if len(calls) > 1 else 0,
+        "sends": len(delays),
+        "send_p50_s": round(percentile(delays, 50), 6),
+        "send_p99_s": round(percentile(delays, 99), 6),
+        "embed_events": len(all_evs),
+        "embed_p50_s": round(percentile(samples, 50), 6),
+    }
+
+
+async def run(args):
+    from commands import reminder
+    from utils.outbox import outbox
+    reminder.weather_service = FakeWeather()
+    if args.morning:
+        reminder.datetime = morning_clock(reminder.datetime)
+    results = []
+    for guilds, calendars, events in itertools.product(args.guilds, args.calendars, args.events):
+        r = await run_case(args, guilds, calendars, events)
+        results.append(r)
+        print(f"guilds={guilds:4} calendars={calendars:2} events={events:5} "
+              f"first_tick={r['first_tick_s'] * 1000:8.1f}ms tick_p50={r['tick_p50_s'] * 1000:7.2f}ms "
+              f"api_first={r['api_calls_first_tick']:4} api/tick={r['api_calls_per_tick']:6.1f} "
+              f"sends={r['sends']:4} send_p99={r['send_p99_s'] * 1000:8.1f}ms embed={r['embed_p50_s'] * 1000:.2f}ms")
+    await outbox.close()
+    return results
+
+
+# 比べる項目と、悪化とみなす比率（回数は1件でも増えたら悪化、時間は揺れを見込む）
+COMPARE = {"api_calls_first_tick": 1.0, "api_calls_per_tick": 1.0, "sends": 1.0,
+           "first_tick_s": None, "tick_p50_s": None, "send_p99_s": None, "embed_p50_s": None}
+
+
+def compare(results, baseline, tolerance, floor):
+    """baseline と同じ条件の結果を比べ、悪化した項目のリストを返す"""
+    key = lambda r: (r["guilds"], r["calendars"], r["events"], r["shared"])
+    old = {key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = old.get(key(r))
+        if not b: continue
+        for name, ratio in COMPARE.items():
+            if b.get(name) is None or r.get(name) is None: continue
+            limit = b[name] * (ratio or tolerance)
+            # ごく短い時間は誤差が大きいので floor 秒までは見逃す
+            if ratio is None: limit = max(limit, b[name] + floor)
+            if r[name] > limit:
+                regressions.append(f"{key(r)} {name}: {b[name]} -> {r[name]}")
+    return regressions
+
+
+def ints(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", type=ints, default=[1, 10, 50])
+    parser.add_argument("--calendars", type=ints, default=[1, 3])
+    parser.add_argument("--events", type=ints, default=[20, 200])
+    parser.add_argument("--shared", action="store_true", help="全ギルドが同じカレンダーを登録している")
+    parser.add_argument("--ticks", type=int, default=5, help="1条件あたりに回すループの周回数")
+    parser.add_argument("--interval", type=float, default=0.0, help="周回の間の待ち時間（本番は60秒）")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Calendar API 1回にかかる秒数")
+    parser.add_argument("--send-latency", type=float, default=0.05, help="Discord への送信1回にかかる秒数")
+    parser.add_argument("--no-morning", dest="morning", action="store_false", help="1周目に朝の定期連絡を送らない")
+    parser.add_argument("--unthrottled", action="store_true", help="送信キューの流量制限を外す（コードの処理時間だけを見る）")
+    parser.add_argument("--embed-repeat", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--out", help="結果を書き出す JSON")
+    parser.add_argument("--baseline", help="比べる JSON（悪化していれば終了コード1）")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="時間がこの倍率を超えたら悪化")
+    parser.add_argument("--floor", type=float, default=0.005, help="時間の悪化として扱わない差（秒）")
+    args = parser.parse_args()
+
+    # 送信キューとカレンダーキャッシュは import 時に環境変数を読むので、先に設定しておく
+    if args.unthrottled:
+        os.environ["OUTBOX_GLOBAL_RATE"] = os.environ["OUTBOX_CHANNEL_RATE"] = "1000000"
+        os.environ["OUTBOX_CHANNEL_BURST"] = "1000000"
+    # 本番は60秒おきでキャッシュの期限（55秒）が毎周切れるので、それに合わせて毎周差分同期させる
+    os.environ.setdefault("GCAL_CACHE_TTL", "0")
+
+    results = asyncio.run(run(args))
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "params": {k: getattr(args, k) for k in ("ticks", "interval", "api_latency", "send_latency", "morning", "unthrottled")},
+              "results": results}
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 {args.out} に保存しました")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.floor)
+        for line in regressions:
+            print(f"❌ {line}")
+        print("OK" if not regressions else "FAILED")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+出欠ボタンの同時押しストレステスト。
+
+AttendanceView.update_attendance を偽の Interaction で大量に同時実行し、
+  - 押した回数分の変更がすべて保存先に届いていること（最後の回答が残っていること）
+  - 書き込みが同時に2つ走らないこと（書き込み役が1つだけであること）
+  - 処理速度が途中で落ちないこと
+を確かめる。Discord には接続しない。
+
+    python -m bench.stress_attendance --clicks 5000 --users 200 --guilds 5
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from commands.attendance import AttendanceView
+from utils.attendance_store import STATUSES, AttendanceBook
+from utils.data_manager import DataManager
+from utils.storage import StorageBackend
+
+
+class MemoryStore(StorageBackend):
+    """書き込みに時間のかかる保存先の代わり。同時書き込みがあれば数える"""
+    def __init__(self, latency):
+        self.latency = latency
+        self.rows = {}          # (gid, date, uid) -> status
+        self.active = 0
+        self.overlaps = 0
+        self.writes = 0
+
+    async def load(self):
+        return None, []
+
+    async def _slow(self, apply):
+        self.active += 1
+        if self.active > 1: self.overlaps += 1
+        try:
+            await asyncio.sleep(self.latency)
+            apply()
+            self.writes += 1
+        finally:
+            self.active -= 1
+
+    async def write_snapshot(self, data, dirty=None, load_shard=None):
+        rows = {}
+        for gid, gd in data.items():
+            if gid.startswith("_") or gd.get("attendance") is None: continue
+            for d, uid, name, status in AttendanceBook.from_json(gd["attendance"]).rows():
+                rows[(gid, d, uid)] = status
+        await self._slow(lambda: self.rows.update(rows))
+
+    async def append_journal(self, entries, data):
+        rows = {(gid, d, uid): status for op, gid, d, uid, name, status in (e for e in entries if e[0] == "att")}
+        await self._slow(lambda: self.rows.update(rows))
+
+
+class FakeUser:
+    def __init__(self, uid):
+        self.id = uid
+        self.display_name = f"user{uid}"
+
+
+class FakeResponse:
+    async def send_message(self, *args, **kwargs):
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, uid):
+        self.user = FakeUser(uid)
+        self.response = FakeResponse()
+
+
+async def run(args):
+    store = MemoryStore(args.latency)
+    dm = DataManager(None, None, save_interval=args.save_interval, backend=store)
+    day = "2024-04-01"
+    views = {g: AttendanceView(dm, g, day) for g in range(args.guilds)}
+    expected = {}
+    rng = random.Random(args.seed)
+    clicks = [(rng.randrange(args.guilds), rng.randrange(args.users), rng.choice(STATUSES)) for _ in range(args.clicks)]
+    for g, uid, status in clicks:
+        expected[(str(g), day, str(uid))] = status  # 同じ人の最後の回答が残るはず
+
+    # 一定数ずつ同時に押し、かたまりごとの処理速度を記録する
+    rates = []
+    started = time.perf_counter()
+    for i in range(0, len(clicks), args.batch):
+        batch = clicks[i:i + args.batch]
+        t = time.perf_counter()
+        # attend_list などの読み出し側も flush() を呼ぶので、それも同時に走らせる
+        await asyncio.gather(*(views[g].update_attendance(FakeInteraction(uid), status, "✅") for g, uid, status in batch),
+                             *(dm.flush() for _ in range(args.readers)))
+        rates.append(len(batch) / max(time.perf_counter() - t, 1e-9))
+    await dm.flush()
+    elapsed = time.perf_counter() - started
+    await dm.close()
+
+    lost = [k for k, v in expected.items() if store.rows.get(k) != v]
+    for g in range(args.guilds):
+        if not dm.attendance_book(g).rebuild_stats(): lost.append(("stats", g))
+    steady = min(rates) / max(rates) if rates else 1.0
+    print(f"clicks={len(clicks)} elapsed={elapsed:.2f}s throughput={len(clicks) / elapsed:.0f}/s "
+          f"writes={store.writes} overlapping_writes={store.overlaps} lost={len(lost)} "
+          f"batch_rate_min/max={steady:.2f}")
+    ok = not lost and store.overlaps == 0 and steady >= args.min_steady
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clicks", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=500, help="同時に押す数")
+    parser.add_argument("--readers", type=int, default=3, help="かたまりごとに同時に呼ぶ flush() の数")
+    parser.add_argument("--latency", type=float, default=0.02, help="保存先1回の書き込みにかかる秒数")
+    parser.add_argument("--save-interval", type=float, default=0.0)
+    parser.add_argument("--min-steady", type=float, default=0.2, help="かたまりごとの速度の最小/最大がこれを下回ったら失敗")
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 import discord
 from discord import app_commands, ui
 from datetime import datetime, timezone, timedelta
-import io
-import csv
+import asyncio
+from utils.attendance_store import STATUSES
+from utils.attendance_export import DEFAULT_UPLOAD_LIMIT, export_csv, filter_rows
 
 JST = timezone(timedelta(hours=9))
 
 class AttendanceView(ui.View):
+    """
+    出欠ボタン。custom_id を固定しているので、パネルのメッセージIDと日付を覚えておけば
+    再起動後も bot.add_view(..., message_id=...) で同じボタンを使えるようにできる
+    """
     def __init__(self, data_manager, guild_id, date_str):
         super().__init__(timeout=None)
         self.dm = data_manager
@@ -14,28 +19,39 @@ class AttendanceView(ui.View):
         self.date_str = date_str
 
     async def update_attendance(self, it: discord.Interaction, status: str, emoji: str):
-        data = self.dm.get_guild_data(self.guild_id)
-        if "attendance" not in data: data["attendance"] = {}
-        if self.date_str not in data["attendance"]: data["attendance"][self.date_str] = {}
-        
         user_name = it.user.display_name
-        data["attendance"][self.date_str][str(it.user.id)] = {"name": user_name, "status": status}
-        await self.dm.save_all()
-        
+        prev = await self.dm.record_attendance(self.guild_id, self.date_str, it.user.id, user_name, status)
+
+        if prev and prev != status:
+            return await it.response.send_message(f"{emoji} **{prev} → {status}** に変更しました（{user_name}さん）", ephemeral=True)
         await it.response.send_message(f"{emoji} **{status}** で記録しました（{user_name}さん）", ephemeral=True)
 
-    @ui.button(label="出席", style=discord.ButtonStyle.success, emoji="✅")
+    @ui.button(label="出席", style=discord.ButtonStyle.success, emoji="✅", custom_id="attend:present")
     async def present(self, it: discord.Interaction, button: ui.Button):
         await self.update_attendance(it, "出席", "✅")
 
-    @ui.button(label="遅刻", style=discord.ButtonStyle.secondary, emoji="⏳") # ここを secondary(gray) に修正
+    @ui.button(label="遅刻", style=discord.ButtonStyle.secondary, emoji="⏳", custom_id="attend:late") # ここを secondary(gray) に修正
     async def late(self, it: discord.Interaction, button: ui.Button):
         await self.update_attendance(it, "遅刻", "⏳")
 
-    @ui.button(label="欠席", style=discord.ButtonStyle.danger, emoji="❌")
+    @ui.button(label="欠席", style=discord.ButtonStyle.danger, emoji="❌", custom_id="attend:absent")
     async def absent(self, it: discord.Interaction, button: ui.Button):
         await self.update_attendance(it, "欠席", "❌")
 
+def remember_board(data_manager, guild_id, message, date_str):
+    """送った出欠パネルを覚えておく（restore_attendance_views で使う）"""
+    if message is not None:
+        data_manager.add_attendance_board(guild_id, message.id, date_str)
+
+def restore_attendance_views(bot, data_manager):
+    """覚えている出欠パネルのボタンを登録し直す（起動時に1回）。登録した数を返す"""
+    count = 0
+    for gid, gd in data_manager.guild_items():
+        for message_id, date_str in gd.get("attendance_boards", {}).items():
+            bot.add_view(AttendanceView(data_manager, gid, date_str), message_id=int(message_id))
+            count += 1
+    return count
+
 def register_attendance_commands(bot, data_manager):
     @bot.tree.command(name="attend_board", description="今日の出席確認パネルを出します")
     async def attend_board(it: discord.Interaction):
@@ -45,20 +61,23 @@ def register_attendance_commands(bot, data_manager):
             description="今日の活動に参加できるか、下のボタンを押して教えてください！ @everyone",
             color=0x3498db
         )
-        await it.response.send_message(embed=emb, view=AttendanceView(data_manager, it.guild_id, today))
+        res = await it.response.send_message(embed=emb, view=AttendanceView(data_manager, it.guild_id, today))
+        # discord.py 2.5 以降は応答に message_id が入る（それより前は取り直す）
+        message_id = getattr(res, "message_id", None)
+        message = discord.Object(id=message_id) if message_id else await it.original_response()
+        remember_board(data_manager, it.guild_id, message, today)
 
     @bot.tree.command(name="attend_list", description="今日の出席状況を表示します")
     async def attend_list(it: discord.Interaction):
         today = datetime.now(JST).strftime('%Y-%m-%d')
-        data = data_manager.get_guild_data(it.guild_id)
-        records = data.get("attendance", {}).get(today, {})
+        records = await data_manager.attendance_rows(it.guild_id, today)
         
         if not records:
             return await it.response.send_message(f"まだ {today} の回答はありません。", ephemeral=True)
         
         summary = {"出席": [], "遅刻": [], "欠席": []}
-        for uid, info in records.items():
-            summary[info["status"]].append(info["name"])
+        for date_str, uid, name, status in records:
+            summary[status].append(name)
         
         emb = discord.Embed(title=f"📊 {today} 出席集計", color=0x2ecc71)
         for status, names in summary.items():
@@ -67,30 +86,68 @@ def register_attendance_commands(bot, data_manager):
             
         await it.response.send_message(embed=emb, ephemeral=True)
 
-    @bot.tree.command(name="attend_export", description="これまでの出席データをCSV(Excel用)で書き出します")
-    async def attend_export(it: discord.Interaction):
+    @bot.tree.command(name="attend_stats", description="月ごとの出席・遅刻・欠席の回数と連続出席を表示します (例: 2024-04)")
+    async def attend_stats(it: discord.Interaction, month: str = "", member: discord.Member = None, rebuild: bool = False):
+        month = month.strip() or datetime.now(JST).strftime('%Y-%m')
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            return await it.response.send_message("❌ 月は `2024-04` の形式で指定してください。", ephemeral=True)
+
+        book = await data_manager.load_attendance_book(it.guild_id)
+        note = ""
+        if rebuild:
+            # 検証用: 生の記録から数え直し、途中で数え違いがなかったかを確かめる
+            if not it.user.guild_permissions.manage_guild:
+                return await it.response.send_message("集計の再計算は管理者のみ実行可能です。", ephemeral=True)
+            note = "\n✅ 再計算した結果と一致しました。" if book.rebuild_stats() else "\n⚠️ 再計算で集計を修正しました。"
+
+        stats = book.stats
+        counts = stats.month_counts(month)
+        if member: counts = {uid: c for uid, c in counts.items() if uid == str(member.id)}
+        if not counts:
+            return await it.response.send_message(f"{month} の回答はありません。{note}", ephemeral=True)
+
+        def count(row, status):
+            code = book.statuses.index(status)
+            return row[code] if code < len(row) else 0
+
+        lines = []
+        for uid, row in sorted(counts.items(), key=lambda kv: (-count(kv[1], "出席"), stats.names.get(kv[0], ""))):
+            current, best = stats.streak(uid, book)
+            lines.append(f"**{stats.names.get(uid, uid)}**： " + " / ".join(f"{s} {count(row, s)}" for s in STATUSES)
+                         + f"　🔥 連続出席 {current}（最長 {best}）")
+        shown = lines[:25]
+        if len(lines) > len(shown): shown.append(f"…ほか {len(lines) - len(shown)} 人")
+
+        emb = discord.Embed(title=f"📈 {month} 出席統計", description="\n".join(shown) + note, color=0x9b59b6)
+        await it.response.send_message(embed=emb, ephemeral=True)
+
+    @bot.tree.command(name="attend_export", description="出席データをCSV(Excel用)で書き出します（期間・メンバー・ステータスで絞り込み可）")
+    async def attend_export(it: discord.Interaction, since: str = "", until: str = "", member: discord.Member = None, status: str = "", compress: bool = False):
         await it.response.defer(ephemeral=True) # 処理に時間がかかるかもなので保留
-        
-        data = data_manager.get_guild_data(it.guild_id)
-        attendance_data = data.get("attendance", {})
-        
-        if not attendance_data:
-            return await it.followup.send("まだ出席データがありません。")
 
-        # CSVデータを作成（メモリ上に保持）
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # ヘッダー（1行目）
-        writer.writerow(["日付", "ユーザー名", "出席ステータス"])
-        
-        # データを日付順に整理して書き込み
-        for date_str in sorted(attendance_data.keys()):
-            for user_id, info in attendance_data[date_str].items():
-                writer.writerow([date_str, info["name"], info["status"]])
-        
-        # ファイルとして送信するために変換
-        output.seek(0)
-        file = discord.File(fp=io.BytesIO(output.getvalue().encode('utf-8-sig')), filename=f"attendance_backup_{it.guild_id}.csv")
-        
-        await it.followup.send("これまでの出席データを書き出しました！Excelで開いて確認してください。", file=file)
\ No newline at end of file
+        try:
+            for d in (since, until):
+                if d: datetime.strptime(d, '%Y-%m-%d')
+        except ValueError:
+            return await it.followup.send("❌ 日付は `2024-04-01` の形式で指定してください。")
+        if status and status not in STATUSES:
+            return await it.followup.send(f"❌ ステータスは {' / '.join(STATUSES)} のどれかです。")
+
+        rows = filter_rows(await data_manager.iter_attendance(it.guild_id, since or None, until or None),
+                           user_id=member.id if member else None, status=status or None)
+        limit = it.guild.filesize_limit if it.guild else DEFAULT_UPLOAD_LIMIT
+        # 行はジェネレーターのままスレッドで一時ファイルへ流し込む（上限を超える分は別ファイルに分ける）
+        parts = await asyncio.to_thread(export_csv, rows, limit, compress)
+
+        if not parts:
+            return await it.followup.send("条件に合う出席データがありません。")
+
+        ext = ".csv.gz" if compress else ".csv"
+        for i, (fp, count) in enumerate(parts, 1):
+            suffix = f"_part{i}" if len(parts) > 1 else ""
+            file = discord.File(fp=fp, filename=f"attendance_backup_{it.guild_id}{suffix}{ext}")
+            msg = "出席データを書き出しました！Excelで開いて確認してください。" if i == 1 else ""
+            if len(parts) > 1: msg += f"\n({i}/{len(parts)}: {count} 行)"
+            await it.followup.send(msg.strip(), file=file)
\ No newline at end of file
@@ -1,6 +1,7 @@
 import random
 from discord import app_commands
 import discord
+from utils.outbox import outbox
 
 def register_fun_commands(bot):
     @bot.tree.command(name="roll", description="サイコロを振ります (例: 2d6)")
@@ -24,8 +25,8 @@ def register_fun_commands(bot):
         emojis = ["1️⃣","2️⃣","3️⃣","4️⃣"]
         description = "\n".join(f"{emojis[i]} {opt}" for i,opt in enumerate(options))
         embed = discord.Embed(title=question, description=description, color=0xffa500)
-        msg = await interaction.channel.send(embed=embed, ephemeral=True)
+        msg = await outbox.send(interaction.channel, embed=embed)
         for i in range(len(options)):
-            await msg.add_reaction(emojis[i])
+            await outbox.react(msg, emojis[i])
         await interaction.followup.send("✅ 投票を作成しました", ephemeral=True)
 
@@ -3,14 +3,25 @@ import discord
 import asyncio
 import os
 import json
-import requests
 from datetime import datetime, timezone, timedelta
 import re
 import traceback
 import random
-import csv
+import threading
+import time
 from utils.layout_engine import layout_engine
-from commands.attendance import AttendanceView 
+from utils.calendar_client import AsyncCalendar
+from utils.event_cache import CalendarEventCache
+from utils.fetch_plan import FetchPlan, fetch_stats
+from utils.scheduler import ReminderScheduler, DEFAULT_OFFSETS, parse_offsets, format_offset, format_duration
+from utils.reminder_ledger import ReminderLedger
+from utils.weather import WeatherService, weather_service, guild_location
+from utils.trivia import trivia_store
+from utils.digest import DeliveryTracker, fan_out
+from utils.outbox import outbox, PRIORITY_URGENT, PRIORITY_NORMAL
+from utils.metrics import metrics
+from utils.instrument import profiler, record_failure
+from commands.attendance import AttendanceView, remember_board
 
 # --- 設定項目 ---
 JST = timezone(timedelta(hours=9))
@@ -26,35 +37,12 @@ GENRES = {
     "other": {"label": "その他", "emoji": "📝", "tag": "[他]", "color": 0x95a5a6}
 }
 
-WEATHER_CODES = {
-    0: "☀️快晴", 1: "🌤️晴れ", 2: "⛅くもり", 3: "☁️曇り",
-    45: "🌫️霧", 48: "🌫️霧", 51: "🚿小雨", 53: "🚿小雨", 55: "🚿小雨",
-    61: "☔雨", 63: "☔雨", 65: "☔激しい雨", 71: "❄️雪", 73: "❄️雪", 75: "❄️激しい雪",
-    80: "🌦️にわか雨", 81: "🌦️にわか雨", 82: "🌦️激しいにわか雨", 95: "⚡雷雨"
-}
-
 # --- 雑学取得関数 ---
-def get_trivia():
-    now = datetime.now(JST)
-    # CSVのA列に合わせて「3/31」のような形式の文字列を作る
-    today_str = f"{now.month}/{now.day}"
-    
-    # 雑学ファイルのパス（ファイル名は trivia.csv と仮定します）
-    file_path = "trivia.csv" 
-    
-    if not os.path.exists(file_path):
-        return None
-
-    try:
-        # エンコーディングは、Excelで作ったCSVなら 'utf-8-sig' か 'cp932' が一般的です
-        with open(file_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) >= 2 and row[0] == today_str:
-                    return row[1] # B列の雑学内容を返す
-    except Exception as e:
-        print(f"❌ 雑学取得エラー: {e}")
-    return None
+def get_trivia(now=None, guild_data=None):
+    """今日の雑学（ギルドが選んだ追加パックも候補に含める）"""
+    now = now or datetime.now(JST)
+    packs = (guild_data or {}).get("trivia_packs", [])
+    return trivia_store.get_trivia(now, packs)
 
 # --- ヘルパー関数 ---
 def parse_extended_datetime(date_str, time_str):
@@ -67,24 +55,8 @@ def parse_extended_datetime(date_str, time_str):
     hours, minutes = map(int, match.groups())
     return base_dt + timedelta(days=(hours // 24)) + timedelta(hours=(hours % 24), minutes=minutes)
 
-# --- 天気予報取得関数 ---
-def get_weather():
-    try:
-        url = "https://api.open-meteo.com/v1/forecast?latitude=31.9111&longitude=131.4239&daily=weathercode,temperature_2m_max,temperature_2m_min&timezone=Asia%2FTokyo"
-        r = requests.get(url, timeout=5).json()
-        forecast = {}
-        for i, d in enumerate(r['daily']['time']):
-            code = r['daily']['weathercode'][i]
-            w_text = WEATHER_CODES.get(code, "❓")
-            t_max = r['daily']['temperature_2m_max'][i]
-            t_min = r['daily']['temperature_2m_min'][i]
-            forecast[d] = f"{w_text} ({t_max}℃/{t_min}℃)"
-        return forecast
-    except:
-        return {}
-    
 # --- 通知用Embed作成関数 ---
-def create_daily_embed(now, weather_forecast, trivia, all_evs, is_test=False):
+def create_daily_embed(now, weather_forecast, trivia, all_evs, is_test=False, theme=None):
     today_str = now.strftime('%Y-%m-%d')
     wd = WEEKDAYS[now.weekday()]
     
@@ -106,32 +78,65 @@ def create_daily_embed(now, weather_forecast, trivia, all_evs, is_test=False):
     data = {
     "date": f"{now.month}/{now.day} ({WEEKDAYS[now.weekday()]})",
     "weather": today_weather,
-    "trivia": get_trivia(),
+    "trivia": trivia,
     "today_events": today_evs,
     "future_events": future_evs
     }
     
-    emb = layout_engine.build_embed(data, GENRES)
+    emb = layout_engine.build_embed(data, GENRES, theme)
     
     return emb
 
 # --- Google Calendar 管理クラス ---
 class GoogleCalendarManager:
-    def __init__(self):
-        from google.oauth2 import service_account
+    """
+    Google Calendar API の同期クライアント。
+    google ライブラリの読み込み・認証・API クライアントの生成は重いので、最初に service を使うとき
+    （AsyncCalendar 経由ならワーカースレッド上）まで遅らせる。
+    googleapiclient の通信（httplib2）はスレッドセーフではないため、service はスレッドごとに作る。
+    service を渡せばそれを全スレッドで使う
+    """
+    def __init__(self, service=None):
+        self._shared = service
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.creds = None
+        self._creds_loaded = False
+
+    @property
+    def service(self):
+        if self._shared is not None: return self._shared
+        if not hasattr(self._local, "service"):
+            self._local.service = self._build()
+        return self._local.service
+
+    def _credentials(self):
+        """認証情報は全スレッドで1つ（読み込みは最初の1回だけ）"""
+        with self._lock:
+            if not self._creds_loaded:
+                self._creds_loaded = True
+                creds_json = os.getenv("GOOGLE_CREDENTIALS_JSON")
+                if creds_json:
+                    from google.oauth2 import service_account
+                    try:
+                        info = json.loads(creds_json, strict=False)
+                        if "private_key" in info:
+                            info["private_key"] = info["private_key"].replace("\\n", "\n")
+                        self.creds = service_account.Credentials.from_service_account_info(info, scopes=SCOPES)
+                    except Exception as e:
+                        print(f"❌ Google カレンダーの認証情報の読み込みに失敗: {e}")
+            return self.creds
+
+    def _build(self):
+        creds = self._credentials()
+        if not creds: return None
         from googleapiclient.discovery import build
-        creds_json = os.getenv("GOOGLE_CREDENTIALS_JSON")
-        if creds_json:
-            try:
-                info = json.loads(creds_json, strict=False)
-                if "private_key" in info:
-                    info["private_key"] = info["private_key"].replace("\\n", "\n")
-                self.creds = service_account.Credentials.from_service_account_info(info, scopes=SCOPES)
-                self.service = build('calendar', 'v3', credentials=self.creds)
-            except:
-                self.service = None
-        else:
-            self.service = None
+        try:
+            # ディスカバリー文書はライブラリ同梱の静的コピーを使う（起動のたびに取得しない）
+            return build('calendar', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
+        except Exception as e:
+            print(f"❌ Google カレンダーの初期化に失敗: {e}")
+            return None
 
     def add_event(self, calendar_id, title, date_str, start_time_str=None, end_time_str=None):
         if not self.service: return
@@ -143,6 +148,12 @@ class GoogleCalendarManager:
         body = self._create_body(title, date_str, start_time_str, end_time_str)
         return self.service.events().update(calendarId=calendar_id, eventId=event_id, body=body).execute()
 
+    def get_event(self, calendar_id, event_id):
+        return self.service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+
+    def delete_event(self, calendar_id, event_id):
+        return self.service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+
     def _create_body(self, title, date_str, start_time_str, end_time_str):
         if start_time_str:
             s_dt = parse_extended_datetime(date_str, start_time_str)
@@ -154,6 +165,10 @@ class GoogleCalendarManager:
         else:
             return {'summary': title, 'start': {'date': date_str}, 'end': {'date': (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')}}
 
+    def list_events(self, calendar_id, **params):
+        if not self.service: return {}
+        return self.service.events().list(calendarId=calendar_id, **params).execute()
+
     def get_events(self, calendar_id, days=7):
         if not self.service: return []
         now = datetime.now(JST)
@@ -162,7 +177,9 @@ class GoogleCalendarManager:
         try:
             res = self.service.events().list(calendarId=calendar_id, timeMin=time_min, timeMax=time_max, singleEvents=True, orderBy='startTime').execute()
             return res.get('items', [])
-        except: return []
+        except Exception as e:
+            print(f"❌ 予定の取得に失敗 ({calendar_id}): {e}")
+            return []
 
 # --- UIパーツ：モーダル ---
 
@@ -182,9 +199,10 @@ class UniversalAddModal(ui.Modal, title="予定の登録"):
         await it.response.defer(ephemeral=True)
         tagged_title = f"{self.genre['tag']} {self.title_input.value}"
         try:
-            self.gcal.add_event(self.cid, tagged_title, self.date_input.value, self.start_input.value or None, self.end_input.value or None)
+            await self.gcal.add_event(self.cid, tagged_title, self.date_input.value, self.start_input.value or None, self.end_input.value or None)
             await it.followup.send(f"✅ {self.genre['emoji']} **{tagged_title}** を登録しました！", ephemeral=True)
-        except:
+        except Exception as e:
+            record_failure(e)
             await it.followup.send("❌ 形式エラー。日付や時間を確認してください。", ephemeral=True)
 
 class UniversalEditModal(ui.Modal, title="予定の編集"):
@@ -204,9 +222,10 @@ class UniversalEditModal(ui.Modal, title="予定の編集"):
     async def on_submit(self, it: discord.Interaction):
         await it.response.defer(ephemeral=True)
         try:
-            self.gcal.update_event(self.cid, self.event_id, self.title_input.value, self.date_input.value, self.start_input.value or None, self.end_input.value or None)
+            await self.gcal.update_event(self.cid, self.event_id, self.title_input.value, self.date_input.value, self.start_input.value or None, self.end_input.value or None)
             await it.followup.send(f"✅ **{self.title_input.value}** に更新完了！", ephemeral=True)
-        except:
+        except Exception as e:
+            record_failure(e)
             await it.followup.send("❌ 更新に失敗しました。", ephemeral=True)
 
 # --- UIパーツ：ビュー ---
@@ -273,10 +292,10 @@ class ReminderMenuView(ui.View):
         cids = data.get("calendar_ids", [])
         if not cids: return await it.followup.send("❌ カレンダー未登録です。", ephemeral=True)
 
-        weather = get_weather()
+        weather = await weather_service.get_forecast(guild_location(data))
         all_events = []
-        for cid in cids:
-            all_events.extend(self.gcal.get_events(cid, days=7))
+        for evs in await asyncio.gather(*(self.gcal.get_events(cid, days=7) for cid in cids)):
+            all_events.extend(evs)
         
         if not all_events: return await it.followup.send("✨ 予定はありません。", ephemeral=True)
         all_events.sort(key=lambda x: x['start'].get('dateTime', x['start'].get('date')))
@@ -313,11 +332,11 @@ class ReminderMenuView(ui.View):
             async def on_submit(self, sit: discord.Interaction):
                 raw_id = self.ev_id_input.value.strip().replace("`","")
                 try:
-                    event = self.gcal.service.events().get(calendarId=self.cid, eventId=raw_id).execute()
+                    event = await self.gcal.get_event(self.cid, raw_id)
                     view = EditLaunchView(self.gcal, self.cid, raw_id, event)
                     
                     async def del_callback(dit: discord.Interaction):
-                        self.gcal.service.events().delete(calendarId=self.cid, eventId=raw_id).execute()
+                        await self.gcal.delete_event(self.cid, raw_id)
                         await dit.response.edit_message(content="🗑️ 削除しました。", embed=None, view=None)
                     
                     del_btn = ui.Button(label="🗑️ 削除する", style=discord.ButtonStyle.danger)
@@ -326,7 +345,9 @@ class ReminderMenuView(ui.View):
                     
                     emb = discord.Embed(title="🔍 予定を確認", description=f"予定名: **{event.get('summary')}**", color=0x3498db)
                     await sit.response.send_message(embed=emb, view=view, ephemeral=True)
-                except: await sit.response.send_message("❌ IDが見つかりません。", ephemeral=True)
+                except Exception as e:
+                    record_failure(e)
+                    await sit.response.send_message("❌ IDが見つかりません。", ephemeral=True)
         
         await it.response.send_modal(ManageModal(self.gcal, cids[0]))
 
@@ -336,27 +357,73 @@ class ReminderMenuView(ui.View):
             cid_input = ui.TextInput(label="GoogleカレンダーID", placeholder="example@group.calendar.google.com")
             def __init__(self, dm): super().__init__(); self.dm = dm
             async def on_submit(self, sit: discord.Interaction):
-                d = self.dm.get_guild_data(sit.guild_id)
-                if "calendar_ids" not in d: d["calendar_ids"] = []
                 val = self.cid_input.value.strip()
-                if val not in d["calendar_ids"]: d["calendar_ids"].append(val)
-                await self.dm.save_all()
+                def add(gd):
+                    if val in gd.get("calendar_ids", []): return False
+                    self.dm.add_calendar_id(sit.guild_id, val)
+                    return True
+                if not await self.dm.mutate(sit.guild_id, add):
+                    return await sit.response.send_message(f"ℹ️ すでに登録済みです: `{val}`", ephemeral=True)
                 await sit.response.send_message(f"✅ 追加しました: `{val}`", ephemeral=True)
         await it.response.send_modal(CalModal(self.dm))
 
 # --- コマンド登録と通知ループ ---
-def register_reminder_commands(bot, data_manager):
-    gcal = GoogleCalendarManager()
+def register_reminder_commands(bot, data_manager, calendar=None, interval=60):
+    """calendar: GoogleCalendarManager の代わりに使う同期クライアント、interval: 通知ループの周期（秒）"""
+    gcal = AsyncCalendar(calendar or GoogleCalendarManager())
+    # 10分前通知・朝の定期連絡・「予定を確認」で同じキャッシュを共有する
+    gcal.use_cache(CalendarEventCache(gcal))
+
+    @metrics.collector
+    def calendar_metrics():
+        return [("utool_calendar_sync_total", "counter", "予定キャッシュの同期・ヒット回数",
+                 [({"event": k}, v) for k, v in list(gcal.cache.stats.items())]),
+                ("utool_calendar_fetches_total", "counter", "通知ループのカレンダー取得回数（ギルドごとに取った場合・実際・節約）",
+                 [({"kind": k}, fetch_stats[k]) for k in ("requested", "fetched", "saved")])]
 
     class Reminder(app_commands.Group):
         def __init__(self): super().__init__(name="rem", description="カレンダー管理")
         @app_commands.command(name="setup", description="通知先を設定")
         async def setup(self, it: discord.Interaction):
-            data = data_manager.get_guild_data(it.guild_id)
-            data["reminder"] = {"enabled": True, "channel_id": it.channel_id}
-            await data_manager.save_all()
+            data_manager.set_reminder(it.guild_id, enabled=True, channel_id=it.channel_id)
             await it.response.send_message(f"✅ <#{it.channel_id}> を通知先に設定しました。", ephemeral=True)
 
+        @app_commands.command(name="offsets", description="開始前通知のタイミングを設定 (例: 1d,1h,10m)")
+        async def offsets(self, it: discord.Interaction, timing: str):
+            try:
+                offs = parse_offsets(timing)
+            except ValueError as e:
+                return await it.response.send_message(f"❌ {e}。例: `1d,1h,10m`", ephemeral=True)
+            data_manager.set_reminder(it.guild_id, offsets=offs)
+            await it.response.send_message(f"✅ 通知タイミング: {'・'.join(format_offset(o) for o in offs)}", ephemeral=True)
+
+        @app_commands.command(name="location", description="天気予報の地点を設定 (緯度・経度)")
+        async def location(self, it: discord.Interaction, latitude: float, longitude: float, name: str = None):
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                return await it.response.send_message("❌ 緯度・経度の範囲が正しくありません。", ephemeral=True)
+            loc = {"name": name or f"{latitude:.2f},{longitude:.2f}", "lat": latitude, "lon": longitude}
+            data_manager.set_weather_location(it.guild_id, loc)
+            await it.response.send_message(f"✅ 天気の地点を **{loc['name']}** に設定しました。", ephemeral=True)
+
+        @app_commands.command(name="trivia", description="朝の雑学に追加パックを使う (例: science,history / 空で解除)")
+        async def trivia(self, it: discord.Interaction, packs: str = ""):
+            names = [p.strip() for p in packs.split(",") if p.strip()]
+            available = trivia_store.available_packs()
+            unknown = [n for n in names if n not in available]
+            if unknown:
+                return await it.response.send_message(f"❌ 見つからないパック: {', '.join(unknown)}\n利用可能: {', '.join(available) or 'なし'}", ephemeral=True)
+            data_manager.set_trivia_packs(it.guild_id, names)
+            await it.response.send_message(f"✅ 雑学パック: {', '.join(names) or '標準のみ'}", ephemeral=True)
+
+        @app_commands.command(name="theme", description="定期連絡のデザインテーマを選ぶ (空で標準)")
+        async def theme(self, it: discord.Interaction, name: str = ""):
+            name = name.strip()
+            available = layout_engine.available_themes()
+            if name and name not in available:
+                return await it.response.send_message(f"❌ テーマ `{name}` はありません。\n利用可能: {', '.join(available) or 'なし'}", ephemeral=True)
+            data_manager.set_theme(it.guild_id, name or None)
+            await it.response.send_message(f"✅ テーマ: {name or '標準'}", ephemeral=True)
+
         @app_commands.command(name="menu", description="管理パネルを表示")
         async def menu(self, it: discord.Interaction):
             emb = discord.Embed(title="🗓️ カレンダー操作パネル", description="複数カレンダー対応・予定の管理が可能です。", color=0x4285F4)
@@ -382,15 +449,16 @@ def register_reminder_commands(bot, data_manager):
                 today = now.strftime('%Y-%m-%d')
                 # 全てのカレンダーから予定を取得
                 all_evs = []
-                for cid in cids:
-                    all_evs.extend(gcal.get_events(cid, days=7))
+                for evs in await asyncio.gather(*(gcal.get_events(cid, days=7) for cid in cids)):
+                    all_evs.extend(evs)
                 
                 # 共通関数でEmbedを作成
-                emb = create_daily_embed(now, get_weather(), get_trivia(), all_evs, is_test=True)
+                weather = await weather_service.get_forecast(guild_location(gdata))
+                emb = create_daily_embed(now, weather, get_trivia(now, gdata), all_evs, is_test=True, theme=gdata.get("theme"))
                 
                 target_ch = bot.get_channel(target_ch_id)
                 if target_ch:
-                    await target_ch.send(embed=emb)
+                    await outbox.send(target_ch, embed=emb)
 
                     # --- ここから追加：出欠確認パネルの送信 ---
                     att_emb = discord.Embed(
@@ -400,12 +468,14 @@ def register_reminder_commands(bot, data_manager):
                     )
                     # AttendanceViewを初期化して送信
                     view = AttendanceView(data_manager, gid, today)
-                    await target_ch.send(embed=att_emb, view=view)
+                    msg = await outbox.send(target_ch, embed=att_emb, view=view)
+                    remember_board(data_manager, gid, msg, today)
                     # --- ここまで追加 ---
 
                     await it.followup.send(f"✅ <#{target_ch_id}> にテスト送信しました。")
             except Exception as e:
                 print(traceback.format_exc())
+                record_failure(e)
                 await it.followup.send(f"❌ エラー: `{e}`")
 
     bot.tree.add_command(Reminder())
@@ -437,66 +507,150 @@ def register_reminder_commands(bot, data_manager):
             # 1時間(180秒)ごとに切り替え
             await asyncio.sleep(180)
 
+    async def send_reminder(job):
+        """スケジューラから期限が来た通知を受け取って送信する"""
+        key = ReminderLedger.key(job)
+        if key in reminded: return
+        r = data_manager.get_guild_data(job.gid).get("reminder", {})
+        ch = bot.get_channel(r.get("channel_id"))
+        if not r.get("enabled") or not ch: return
+        summary = job.event.get('summary', '無題')
+        color = 0xe74c3c
+        for k, info in GENRES.items():
+            if info["tag"] in summary: color = info["color"]; break
+        # 開始前通知は定期連絡やデータ保存より先に送る
+        start = datetime.fromtimestamp(job.start, JST)
+        left = max(1, round((job.start - time.time()) / 60))
+        desc = f"あと{format_duration(left)}で開始します（{start.month}/{start.day} ({WEEKDAYS[start.weekday()]}) {start:%H:%M}）。"
+        await outbox.send(ch, PRIORITY_URGENT, content=f"🕒 {format_offset(job.offset)}", embed=discord.Embed(title=summary, description=desc, color=color))
+        # 開始時刻まで覚えておき、再起動後も同じ通知を送らないよう保存する
+        reminded.add(key, job.start)
+        data_manager.add_reminded(key, job.start)
+
+    reminded = ReminderLedger()
+    reminded.load(data_manager.get_system_data("reminded", []))
+    scheduler = ReminderScheduler(send_reminder)
+    # イベントの追加・移動・削除はキャッシュから直接スケジューラへ
+    gcal.cache.listeners.append(scheduler.on_event_changed)
+
+    def attendance_panel(gid, today):
+        att_emb = discord.Embed(
+            title=f"📝 {today} 出欠確認",
+            description="今日の活動に参加できるか、下のボタンを押して教えてください！ @everyone",
+            color=0x2ecc71 # 出席用の緑色
+        )
+        return att_emb, AttendanceView(data_manager, gid, today)
+
+    digest_state = DeliveryTracker(data_manager.get_system_data("digest_delivered", {}),
+                                   data_manager.get_system_data("digest_panels", {}))
+
+    async def send_morning_digest(now, targets, plan, weekly):
+        """
+        同じカレンダー・地点・雑学パック・テーマのギルドはまとめて1回だけ Embed を作り、
+        配信は上限付きで並行に行う
+        """
+        today = now.strftime('%Y-%m-%d')
+        is_weekday = now.weekday() < 5
+        started = time.monotonic()
+        groups, panels_only = {}, []
+        for gid, ch, cids, offs in targets:
+            if digest_state.delivered(gid, today):
+                # 本文は届いていて出欠パネルだけ失敗していたら、パネルだけ送り直す
+                if is_weekday and not digest_state.panel_delivered(gid, today): panels_only.append((gid, ch))
+                continue
+            gd = data_manager.get_guild_data(gid)
+            key = (tuple(sorted(set(cids))), WeatherService._key(guild_location(gd)),
+                   tuple(gd.get("trivia_packs", [])), gd.get("theme"))
+            groups.setdefault(key, []).append((gid, ch, gd))
+        if not groups and not panels_only: return
+
+        async def send_panel(gid, ch):
+            att_emb, view = attendance_panel(gid, today)
+            msg = await outbox.send(ch, PRIORITY_NORMAL, embed=att_emb, view=view)
+            remember_board(data_manager, gid, msg, today)
+            digest_state.mark_panel(gid, today)
+
+        async def deliver(gid, ch, emb):
+            await outbox.send(ch, PRIORITY_NORMAL, embed=emb)
+            # 本文は届いたので、この後パネルの送信に失敗しても本文は送り直さない
+            digest_state.mark(gid, today, time.monotonic() - started)
+            if is_weekday: await send_panel(gid, ch)
+
+        jobs, gids = [], []
+        for members in groups.values():
+            gid0, ch0, gd0 = members[0]
+            weather = await weather_service.get_forecast(guild_location(gd0))
+            # 共通関数を呼び出し（is_testはデフォルトFalse）
+            emb = create_daily_embed(now, weather, get_trivia(now, gd0), plan.events_for(gid0, weekly), theme=gd0.get("theme"))
+            jobs.extend(deliver(gid, ch, emb) for gid, ch, gd in members)
+            gids.extend(gid for gid, ch, gd in members)
+        jobs.extend(send_panel(gid, ch) for gid, ch in panels_only)
+        gids.extend(gid for gid, ch in panels_only)
+
+        for gid, res in zip(gids, await fan_out(jobs)):
+            if isinstance(res, Exception): print(f"❌ 定期連絡の送信失敗 ({gid}): {res}")
+        data_manager.set_system_data("digest_delivered", digest_state.state)
+        data_manager.set_system_data("digest_panels", digest_state.panels)
+        retry = f" + 出欠パネルの再送 {len(panels_only)} 件" if panels_only else ""
+        print(f"📨 定期連絡: {len(groups)} グループ{retry} / {digest_state.summary()} / 送信キュー: {outbox.summary()}")
+
     async def notification_loop():
         await bot.wait_until_ready()
-        reminded_ids = set()
-        last_morning = ""
+        last_subscriptions = None
+        last_resync = 0
+        metrics.histogram("utool_loop_tick_seconds", "notification_loop 1周の処理時間")
+        expected = None
         while not bot.is_closed():
-            now = datetime.now(JST)
-            today = now.strftime('%Y-%m-%d')
-            is_weekday = now.weekday() < 5
-            for gid, gd in data_manager.data.items():
-                r = gd.get("reminder", {})
-                if not r.get("enabled"): continue
-                ch = bot.get_channel(r.get("channel_id"))
-                cids = gd.get("calendar_ids", [])
-                if not ch or not cids: continue
+            tick = time.monotonic()
+            # 予定どおり起きられたか（イベントループが詰まっていると遅れる）
+            if expected is not None:
+                metrics.set("utool_loop_lag_seconds", max(0.0, tick - expected), "前回の予定時刻から実際に起きるまでの遅れ", loop="notification")
+            # PROFILE_SLOW_MS を超えた周回は cProfile の結果を書き出す
+            async with profiler.profile("loop:notification"):
+                now = datetime.now(JST)
+                today = now.strftime('%Y-%m-%d')
+
+                targets = []
+                for gid, gd in data_manager.guild_items():
+                    r = gd.get("reminder", {})
+                    if not r.get("enabled"): continue
+                    ch = bot.get_channel(r.get("channel_id"))
+                    cids = gd.get("calendar_ids", [])
+                    if not ch or not cids: continue
+                    targets.append((gid, ch, cids, r.get("offsets", DEFAULT_OFFSETS)))
+                # 朝6時台で、まだ今日の定期連絡を受け取っていないギルドがあれば配信する
+                is_morning = now.hour == 6 and any(digest_state.pending(gid, today, now.weekday() < 5) for gid, ch, cids, offs in targets)
+
+                # 最も早い開始前通知の分だけ、全件取得の期間を先まで延ばす
+                gcal.cache.set_lookahead(max((max(offs, default=0) for gid, ch, cids, offs in targets), default=0))
+                # 同じカレンダーを登録しているギルドが複数あっても取得は1回だけ
+                plan = FetchPlan((gid, cids) for gid, ch, cids, offs in targets)
+                weekly = await plan.fetch(gcal, days=7) if is_morning else {}
+                # 差分同期で見つかった変更はリスナー経由でスケジューラに反映される
+                await plan.fetch(gcal, days=1)
+
+                # 購読・通知タイミングが変わったとき／1時間ごとに期限を作り直す
+                subscriptions = {gid: (tuple(cids), tuple(offs)) for gid, ch, cids, offs in targets}
+                if subscriptions != last_subscriptions or now.timestamp() - last_resync > 3600:
+                    scheduler.set_subscriptions(plan.subscribers, {gid: offs for gid, ch, cids, offs in targets})
+                    for gid in set(last_subscriptions or {}) - set(subscriptions):
+                        scheduler.cancel_guild(gid)
+                    # 最大のオフセットが長いギルドがあれば、その分だけ先の予定まで期限を作る
+                    days = scheduler.window_days()
+                    for gid, ch, cids, offs in targets:
+                        scheduler.sync_guild(gid, {cid: gcal.cache.cached_events(cid, days=days) for cid in cids})
+                    last_subscriptions, last_resync = subscriptions, now.timestamp()
 
                 # 朝6時の通知
-                if now.hour == 6 and now.minute == 0 and last_morning != today:
-                    all_evs = []
-                    for cid in cids:
-                        all_evs.extend(gcal.get_events(cid, days=7))
-                    
-                    # 共通関数を呼び出し（is_testはデフォルトFalse）
-                    emb = create_daily_embed(now, get_weather(), get_trivia(), all_evs)
-                    
-                    await ch.send(embed=emb)
-                    
-                    if is_weekday:
-                        # --- ここから追加：出欠確認パネルの送信 ---
-                        att_emb = discord.Embed(
-                            title=f"📝 {today} 出欠確認",
-                            description="今日の活動に参加できるか、下のボタンを押して教えてください！ @everyone",
-                            color=0x2ecc71 # 出席用の緑色
-                        )
-                        # AttendanceViewを初期化して送信
-                        view = AttendanceView(data_manager, gid, today)
-                        await ch.send(embed=att_emb, view=view)
-                        # --- ここまで追加 ---
-                        
-                        if gid == list(data_manager.data.keys())[-1]: 
-                            last_morning = today
-
-                # 10分前通知
-                for cid in cids:
-                    try:
-                        for e in gcal.get_events(cid, days=1):
-                            st = e['start'].get('dateTime')
-                            if st and e['id'] not in reminded_ids:
-                                dt = datetime.fromisoformat(st.replace('Z', '+00:00')).astimezone(JST)
-                                if 0 < (dt - now).total_seconds() <= 605:
-                                    summary = e.get('summary', '無題')
-                                    color = 0xe74c3c
-                                    for k, info in GENRES.items():
-                                        if info["tag"] in summary: color = info["color"]; break
-                                    await ch.send(content="🕒 10分前", embed=discord.Embed(title=summary, description="間もなく開始します。", color=color))
-                                    reminded_ids.add(e['id'])
-                    except: pass
-            if len(reminded_ids) > 200: reminded_ids.clear()
-            await asyncio.sleep(60)
+                if is_morning:
+                    await send_morning_digest(now, targets, plan, weekly)
+
+            metrics.observe("utool_loop_tick_seconds", time.monotonic() - tick, loop="notification")
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
 
     if not hasattr(bot, "_reminder_loops"):
         bot._reminder_loops = True
         asyncio.create_task(status_loop())
-        asyncio.create_task(notification_loop())
\ No newline at end of file
+        asyncio.create_task(notification_loop())
+        asyncio.create_task(scheduler.run())
\ No newline at end of file
@@ -1,25 +1,44 @@
+import time
+# 起動時間の計測の起点（import にかかる時間も含める）
+STARTED = time.perf_counter()
 import os
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
-import nest_asyncio
-from flask import Flask
 import threading
-import requests
-import time
 import sys
+import math
 
 # ユーティリティ
 from utils.data_manager import DataManager
-from commands import help, utility, fun, reminder, attendance
+from utils.storage import ChannelStore, SQLiteStore
+from utils.weather import weather_service
+from utils.outbox import outbox, PRIORITY_NAMES
+from utils.metrics import metrics, hit_rate
+from utils.trivia import trivia_stats
+from utils import instrument
+from utils.command_sync import sync_commands
+# Flask・requests・各コマンドのモジュールは使うときに読み込む（再起動のたびに待たされる時間を減らす）
 
 load_dotenv()
-nest_asyncio.apply()
+# 入れ子のイベントループが必要なときだけ（NEST_ASYNCIO=1）
+if os.getenv("NEST_ASYNCIO") == "1":
+    import nest_asyncio
+    nest_asyncio.apply()
+# コマンド・ボタン・モーダルの応答時間・defer・失敗を記録する
+instrument.install()
 
 TOKEN = os.getenv("TOKEN")
 PORT = int(os.getenv("PORT", 10000))
 SELF_URL = os.getenv("SELF_URL")
 DATA_CHANNEL_ID = int(os.getenv("DATA_CHANNEL_ID", "0"))
+# 保存先: channel（データ用チャンネル）または sqlite（ローカルDB + チャンネルへバックアップ）
+STORAGE = os.getenv("STORAGE", "channel")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "utool.db")
+# 開発用: 指定したギルドにだけコマンドを同期する（グローバル同期より早く反映される）
+DEV_GUILD_ID = int(os.getenv("DEV_GUILD_ID", "0"))
+# コマンドに変更がなくても同期する
+FORCE_SYNC = os.getenv("FORCE_SYNC", "") == "1"
 
 if not TOKEN or DATA_CHANNEL_ID == 0:
     print("❌ ERROR: TOKEN または DATA_CHANNEL_ID が設定されていません。")
@@ -29,43 +48,112 @@ if not TOKEN or DATA_CHANNEL_ID == 0:
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
 
-# Flask (Koyeb/Render スリープ防止用)
-app = Flask(__name__)
-@app.route('/')
-def health(): return "Bot is running!", 200
+class UtoolBot(commands.Bot):
+    data_manager = None
+
+    async def close(self):
+        # 保存待ちのデータを書き出してから終了する
+        if self.data_manager:
+            try: await self.data_manager.close()
+            except Exception as e: print(f"❌ 終了時の保存に失敗: {e}")
+        await outbox.close()
+        await weather_service.close()
+        await super().close()
+
+bot = UtoolBot(command_prefix="!", intents=intents)
+
+# Flask (Koyeb/Render スリープ防止用)。Flask はこのサーバーのスレッドで読み込む
+def create_app():
+    from flask import Flask
+    app = Flask(__name__)
+    @app.route('/')
+    def health(): return "Bot is running!", 200
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    return app
+
+@metrics.collector
+def bot_metrics():
+    latency = bot.latency
+    guilds, shards, records, size = data_manager.memory_usage()
+    ws = weather_service.stats
+    return [
+        ("utool_gateway_latency_seconds", "gauge", "Discord ゲートウェイのハートビート遅延",
+         [({}, latency if math.isfinite(latency) else -1)]),
+        ("utool_guilds", "gauge", "参加しているギルド数", [({}, len(bot.guilds))]),
+        ("utool_data_guilds", "gauge", "データを持っているギルド数", [({}, guilds)]),
+        ("utool_data_loaded_shards", "gauge", "メモリに読み込まれている出欠シャード数", [({}, shards)]),
+        ("utool_data_attendance_records", "gauge", "メモリ上の出欠記録の件数", [({}, records)]),
+        ("utool_data_bytes", "gauge", "メモリ上のデータのおおよそのバイト数", [({}, size)]),
+        ("utool_data_ops_total", "counter", "DataManager の保存要求・書き込み回数など",
+         [({"op": k}, v) for k, v in list(data_manager.stats.items())]),
+        ("utool_cache_hit_ratio", "gauge", "キャッシュのヒット率",
+         [({"cache": "weather"}, hit_rate(ws["hits"], ws["misses"])),
+          ({"cache": "trivia"}, hit_rate(trivia_stats["hits"], trivia_stats["reloads"]))]),
+        ("utool_weather_requests_total", "counter", "天気予報の取得結果", [({"result": k}, v) for k, v in list(ws.items())]),
+        ("utool_outbox_depth", "gauge", "送信待ちのメッセージ数", [({}, outbox.depth)]),
+        ("utool_outbox_total", "counter", "送信キューの送信・再試行・失敗", [({"result": k}, v) for k, v in list(outbox.stats.items())]),
+        ("utool_outbox_wait_seconds_max", "gauge", "送信キューの最大待ち時間",
+         [({"priority": PRIORITY_NAMES.get(p, p)}, s["max"]) for p, s in list(outbox.wait_stats.items())]),
+    ]
 
 def run_flask():
-    app.run(host="0.0.0.0", port=PORT)
+    create_app().run(host="0.0.0.0", port=PORT)
 
 def keep_alive():
     if not SELF_URL: return
+    import requests
     time.sleep(20)
     while True:
         try: requests.get(SELF_URL, timeout=10)
         except: pass
         time.sleep(300)
 
-data_manager = DataManager(bot, DATA_CHANNEL_ID)
+if STORAGE == "sqlite":
+    data_manager = DataManager(bot, DATA_CHANNEL_ID, backend=SQLiteStore(SQLITE_PATH), backup=ChannelStore(bot, DATA_CHANNEL_ID))
+else:
+    data_manager = DataManager(bot, DATA_CHANNEL_ID)
+bot.data_manager = data_manager
 bot.initialized = False
 
+IMPORTED = time.perf_counter()
+
 @bot.event
 async def on_ready():
     if not bot.initialized:
+        ready = time.perf_counter()
         print(f"🚀 {bot.user} としてログインしました。モジュールを初期化します...")
         await data_manager.load_files()
+        loaded = time.perf_counter()
         
         # コマンド登録 (Todoは削除)
+        from commands import help, utility, fun, reminder, attendance
         utility.register_utility_commands(bot)
         fun.register_fun_commands(bot)
         reminder.register_reminder_commands(bot, data_manager)
         help.register_help_command(bot)
         attendance.register_attendance_commands(bot, data_manager)
+        instrument.instrument_tree(bot.tree)
+        # 再起動前に送った出欠パネルのボタンを使えるようにする
+        views = attendance.restore_attendance_views(bot, data_manager)
+        registered = time.perf_counter()
 
-        await bot.tree.sync()
+        try:
+            await sync_commands(bot, data_manager, DEV_GUILD_ID or None, force=FORCE_SYNC)
+        except Exception as e:
+            print(f"❌ コマンドの同期に失敗: {e}")
         bot.initialized = True
-        print(f"✅ すべてのコマンドを同期しました！")
+        done = time.perf_counter()
+
+        phases = {"import": IMPORTED - STARTED, "connect": ready - IMPORTED, "load": loaded - ready,
+                  "register": registered - loaded, "sync": done - registered, "total": done - STARTED}
+        for phase, seconds in phases.items():
+            metrics.set("utool_startup_seconds", seconds, "起動にかかった時間（段階別）", phase=phase)
+        print(f"✅ 起動完了 {phases['total']:.2f}s (" + ", ".join(f"{k}={v:.2f}s" for k, v in phases.items() if k != "total")
+              + f") / 出欠パネル {views} 件を復元")
 
 if __name__ == "__main__":
     threading.Thread(target=run_flask, daemon=True).start()
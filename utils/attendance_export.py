@@ -0,0 +1,67 @@
+import csv
+import gzip
+import io
+import tempfile
+
+HEADER = ["日付", "ユーザー名", "出席ステータス"]
+# Discord の既定のアップロード上限（ギルドのブーストで増える。実際の値は guild.filesize_limit を使う）
+DEFAULT_UPLOAD_LIMIT = 8 * 1024 * 1024
+# 分割の判定に使う余裕（gzip が内部にためている分と、multipart のヘッダー分）
+SIZE_MARGIN = 256 * 1024
+# これを超えるまではメモリ上、超えたら一時ファイルに書く
+SPOOL_MAX = 1024 * 1024
+
+
+def filter_rows(rows, user_id=None, status=None):
+    """(日付, ユーザーID, 名前, ステータス) の流れをメンバー・ステータスで絞り込む（日付の範囲は取り出す側で絞る）"""
+    uid = str(user_id) if user_id is not None else None
+    for row in rows:
+        date_str, row_uid, name, row_status = row
+        if uid and row_uid != uid: continue
+        if status and row_status != status: continue
+        yield row
+
+
+class _Part:
+    """分割された CSV の1ファイル分（SpooledTemporaryFile に直接書く）"""
+    def __init__(self, compress, header):
+        self.raw = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+        self.out = gzip.GzipFile(fileobj=self.raw, mode="wb") if compress else self.raw
+        self.rows = 0
+        # Excel で文字化けしないよう、各ファイルの先頭に BOM とヘッダーを付ける
+        self.out.write(b"\xef\xbb\xbf" + header)
+
+    def size(self):
+        return self.raw.tell()
+
+    def finish(self):
+        if self.out is not self.raw: self.out.close()
+        self.raw.seek(0)
+        return self.raw
+
+
+def export_csv(rows, limit=DEFAULT_UPLOAD_LIMIT, compress=False):
+    """
+    行をジェネレーターのまま CSV に書き出し、アップロード上限を超えそうになったら次のファイルに分ける。
+    書き込み済みのファイルオブジェクト（先頭にシーク済み）と行数の組のリストを返す
+    """
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def encode(values):
+        line.seek(0); line.truncate()
+        writer.writerow(values)
+        return line.getvalue().encode("utf-8")
+
+    header = encode(HEADER)
+    parts = []
+    part = None
+    for date_str, uid, name, status in rows:
+        data = encode([date_str, name, status])
+        if part is None or (part.rows and part.size() + len(data) + SIZE_MARGIN > limit):
+            if part: parts.append((part.finish(), part.rows))
+            part = _Part(compress, header)
+        part.out.write(data)
+        part.rows += 1
+    if part: parts.append((part.finish(), part.rows))
+    return parts
@@ -0,0 +1,239 @@
+from array import array
+
+# 出欠ステータスはこの順に 0, 1, 2 の番号で持つ（それ以外の文字列が来たら後ろに追加する）
+STATUSES = ("出席", "遅刻", "欠席")
+FORMAT_VERSION = 1
+PRESENT = 0  # 連続出席として数えるステータス番号
+
+
+class AttendanceStats:
+    """
+    出欠記録から作る集計（メンバー × 月 × ステータスの回数と、連続出席）。
+    回答のたびに apply() で O(1) 更新する。回答の変更は前のステータスを引いてから足す。
+    連続出席は「そのメンバーが回答した日」を並べたときに出席が続いている回数。
+    """
+    __slots__ = ("counts", "streaks", "names")
+
+    def __init__(self):
+        self.counts = {}   # user_id -> {"YYYY-MM": [ステータス番号ごとの回数]}
+        # user_id -> [最後に回答した日, その日より前の連続, その日より前の最長, 現在の連続, 最長, 要再計算]
+        self.streaks = {}
+        self.names = {}    # user_id -> 最新の表示名
+
+    def apply(self, date_str, uid, name, prev_code, code):
+        month = date_str[:7]
+        row = self.counts.setdefault(uid, {}).setdefault(month, [])
+        while len(row) <= max(code, prev_code if prev_code is not None else 0): row.append(0)
+        if prev_code is not None: row[prev_code] -= 1
+        row[code] += 1
+
+        st = self.streaks.get(uid)
+        if st is None:
+            st = self.streaks[uid] = [None, 0, 0, 0, 0, False]
+        last = st[0]
+        if last is None or date_str >= last: self.names[uid] = name
+        if last is None or date_str > last:
+            # 新しい日の回答: 直前までの値を控えてから伸ばす
+            st[0], st[1], st[2] = date_str, st[3], st[4]
+        elif date_str < last:
+            # 過去の日付への回答は順番が崩れるので、読むときに数え直す
+            st[5] = True
+            return
+        st[3] = st[1] + 1 if code == PRESENT else 0
+        st[4] = max(st[2], st[3])
+
+    def month_counts(self, month):
+        """{user_id: [回数...]}（その月に回答のあるメンバーだけ）"""
+        return {uid: list(months[month]) for uid, months in self.counts.items() if any(months.get(month, ()))}
+
+    def streak(self, uid, book=None):
+        """(現在の連続出席, 最長連続出席)"""
+        st = self.streaks.get(uid)
+        if st is None: return 0, 0
+        if st[5] and book is not None:
+            fresh = AttendanceStats()
+            for d, row_uid, name, code in book.iter_codes():
+                if row_uid == uid: fresh.apply(d, uid, name, None, code)
+            st[:] = fresh.streaks.get(uid, st)
+        return st[3], st[4]
+
+    @classmethod
+    def rebuild(cls, book):
+        """生の記録から集計を作り直す（検証用・読み込み時用）"""
+        stats = cls()
+        for d, uid, name, code in book.iter_codes():
+            stats.apply(d, uid, name, None, code)
+        return stats
+
+    def same_as(self, other, book):
+        """集計が other と一致するか（末尾の 0 の有無は区別しない）"""
+        def normalize(stats):
+            counts = {}
+            for uid, months in stats.counts.items():
+                for m, row in months.items():
+                    row = list(row)
+                    while row and row[-1] == 0: row.pop()
+                    if row: counts[(uid, m)] = row
+            return counts, {uid: stats.streak(uid, book) for uid in stats.streaks}
+        return normalize(self) == normalize(other)
+
+
+class AttendanceBook:
+    """
+    1ギルド分の出欠記録。
+    (ユーザーID, 表示名) の組をメンバー表に1回だけ持ち、日付ごとには
+    「メンバー番号の配列」と「ステータス番号の配列」だけを回答順に並べる。
+    回答時の表示名もメンバー表で区別しているので、旧形式との相互変換で情報は失われない。
+    """
+    __slots__ = ("members", "statuses", "days", "stats", "_member_index", "_status_index", "_ordered")
+
+    def __init__(self):
+        self.members = []          # [(user_id, name), ...]
+        self.statuses = list(STATUSES)
+        self.days = {}             # date -> (array 'I' メンバー番号, bytearray ステータス番号)
+        # days のキーが日付順に並んでいるか（過去の日付が後から追加されたら False）
+        self._ordered = True
+        self._member_index = {}    # (user_id, name) -> メンバー番号
+        self._status_index = {s: i for i, s in enumerate(self.statuses)}
+        self.stats = AttendanceStats()
+
+    # --- 変換 ---
+    @classmethod
+    def from_json(cls, obj):
+        """保存形式（圧縮形式・旧形式のどちらでも）から作る"""
+        if isinstance(obj, cls): return obj
+        book = cls()
+        if not obj: return book
+        if "v" in obj and "days" in obj:
+            book.members = [tuple(m) for m in obj["members"]]
+            book._member_index = {m: i for i, m in enumerate(book.members)}
+            # 保存時の statuses 順で番号を振り直す（既定の3つ以外が混ざっていてもずれない）
+            remap = [book._status_code(s) for s in obj["statuses"]]
+            base = len(obj["statuses"])
+            for date_str, packed in obj["days"].items():
+                book._add_day(date_str, array("I", (v // base for v in packed)), bytearray(remap[v % base] for v in packed))
+            book.stats = AttendanceStats.rebuild(book)
+            return book
+        # 旧形式: {date: {user_id: {"name": ..., "status": ...}}}
+        for date_str, recs in obj.items():
+            for uid, info in recs.items():
+                book.set(date_str, uid, info["name"], info["status"])
+        return book
+
+    def to_json(self):
+        """スナップショット用。日付ごとに「メンバー番号 × ステータス数 + ステータス番号」の整数列にする"""
+        base = len(self.statuses)
+        return {
+            "v": FORMAT_VERSION,
+            "members": [list(m) for m in self.members],
+            "statuses": list(self.statuses),
+            "days": {d: [m * base + c for m, c in zip(idx, codes)] for d, (idx, codes) in self.days.items()},
+        }
+
+    # --- 更新 ---
+    def _member(self, uid, name):
+        key = (uid, name)
+        i = self._member_index.get(key)
+        if i is None:
+            i = self._member_index[key] = len(self.members)
+            self.members.append(key)
+        return i
+
+    def _status_code(self, status):
+        code = self._status_index.get(status)
+        if code is None:
+            if len(self.statuses) >= 256: raise ValueError(f"ステータスの種類が多すぎます: {status}")
+            code = self._status_index[status] = len(self.statuses)
+            self.statuses.append(status)
+        return code
+
+    def _add_day(self, date_str, idx, codes):
+        if self._ordered and self.days and date_str < next(reversed(self.days)): self._ordered = False
+        self.days[date_str] = (idx, codes)
+
+    def set(self, date_str, user_id, name, status):
+        """回答を記録する。同じ日に回答済みなら上書きし、前のステータスを返す（初回は None）"""
+        uid = str(user_id)
+        m, code = self._member(uid, name), self._status_code(status)
+        if date_str not in self.days:
+            self._add_day(date_str, array("I"), bytearray())
+        idx, codes = self.days[date_str]
+        for pos, old in enumerate(idx):
+            if self.members[old][0] == uid:
+                prev_code = codes[pos]
+                idx[pos], codes[pos] = m, code
+                self.stats.apply(date_str, uid, name, prev_code, code)
+                return self.statuses[prev_code]
+        idx.append(m)
+        codes.append(code)
+        self.stats.apply(date_str, uid, name, None, code)
+        return None
+
+    # --- 参照 ---
+    def status_of(self, date_str, user_id):
+        """その日の回答（なければ None）"""
+        uid = str(user_id)
+        idx, codes = self.days.get(date_str, ((), ()))
+        for m, c in zip(idx, codes):
+            if self.members[m][0] == uid: return self.statuses[c]
+        return None
+
+    def dates(self):
+        if not self._ordered:
+            # 順番が崩れたときだけ並べ直す（以降は追加順のまま日付順）
+            self.days = dict(sorted(self.days.items()))
+            self._ordered = True
+        return list(self.days)
+
+    def rows(self, date_str=None):
+        """(日付, ユーザーID, 名前, ステータス) を日付順・回答順に返す"""
+        return list(self.iter_rows(date_str, date_str) if date_str else self.iter_rows())
+
+    def iter_rows(self, since=None, until=None):
+        """rows() のジェネレーター版。since〜until（両端を含む）の日付だけを順に取り出す"""
+        for d, uid, name, c in self.iter_codes(since, until):
+            yield d, uid, name, self.statuses[c]
+
+    def _dates_between(self, since=None, until=None):
+        if since and since == until:
+            # 1日分なら並べ替えずにその日だけ引く
+            return [since] if since in self.days else []
+        return [d for d in self.dates() if not (since and d < since) and not (until and d > until)]
+
+    def iter_codes(self, since=None, until=None):
+        """iter_rows() と同じ順で、ステータスを番号のまま返す"""
+        for d in self._dates_between(since, until):
+            idx, codes = self.days[d]
+            for m, c in zip(idx, codes):
+                uid, name = self.members[m]
+                yield d, uid, name, c
+
+    def frozen_rows(self, since=None, until=None):
+        """
+        iter_rows() と同じ行を返すが、呼んだ時点の中身を写し取っておく。
+        イベントループの外（書き出し用のスレッドなど）で読むとき用で、読んでいる間に記録が増えても影響しない
+        """
+        days = [(d, array("I", self.days[d][0]), bytes(self.days[d][1])) for d in self._dates_between(since, until)]
+        members, statuses = list(self.members), list(self.statuses)
+
+        def rows():
+            for d, idx, codes in days:
+                for m, c in zip(idx, codes):
+                    uid, name = members[m]
+                    yield d, uid, name, statuses[c]
+        return rows()
+
+    def rebuild_stats(self):
+        """集計を生の記録から作り直し、それまでの値と一致していたかを返す"""
+        fresh = AttendanceStats.rebuild(self)
+        ok = self.stats.same_as(fresh, self)
+        self.stats = fresh
+        return ok
+
+    def nbytes(self):
+        """中身のおおよそのバイト数（Python オブジェクト自体の大きさは含まない）"""
+        days = sum(idx.itemsize * len(idx) + len(codes) for idx, codes in self.days.values())
+        return days + sum(len(uid) + len(name.encode("utf-8")) for uid, name in self.members)
+
+    def __len__(self):
+        return sum(len(idx) for idx, _ in self.days.values())
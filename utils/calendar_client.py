@@ -0,0 +1,98 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import metrics
+
+metrics.histogram("utool_calendar_api_seconds", "Calendar API 呼び出しの所要時間（method, result 別）")
+
+
+class AsyncCalendar:
+    """
+    GoogleCalendarManager の同期呼び出しをワーカースレッドで実行する非同期ラッパー。
+    googleapiclient の通信でイベントループ（ハートビートやボタン応答）が止まらないようにする。
+    """
+    def __init__(self, gcal, max_workers=None, max_pending=None, timeout=None):
+        self.gcal = gcal
+        self.max_workers = max_workers or int(os.getenv("GCAL_MAX_WORKERS", "4"))
+        # 同時に待ち行列へ積める呼び出し数（スレッド数 + 待機分）
+        self.max_pending = max_pending or int(os.getenv("GCAL_MAX_PENDING", str(self.max_workers * 4)))
+        self.timeout = timeout or float(os.getenv("GCAL_TIMEOUT", "15"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gcal")
+        self._sem = None
+        self.cache = None
+        self.stats = {"calls": 0, "timeouts": 0, "errors": 0}
+
+    @property
+    def service(self):
+        return self.gcal.service
+
+    def _semaphore(self):
+        # Semaphore は実行中のイベントループ上で作る必要があるため遅延生成
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_pending)
+        return self._sem
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """同期関数をワーカープールで実行し、タイムアウト付きで結果を待つ"""
+        loop = asyncio.get_running_loop()
+        name = getattr(func, '__name__', str(func))
+        async with self._semaphore():
+            self.stats["calls"] += 1
+            fut = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+            started = time.perf_counter()
+            result = "ok"
+            try:
+                return await asyncio.wait_for(fut, timeout or self.timeout)
+            except asyncio.TimeoutError:
+                # スレッド自体は止められないので、結果を捨てて呼び出し元に返す
+                self.stats["timeouts"] += 1
+                result = "timeout"
+                print(f"⏱️ Calendar API タイムアウト: {name}")
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                result = "error"
+                raise
+            finally:
+                metrics.observe("utool_calendar_api_seconds", time.perf_counter() - started, method=name, result=result)
+
+    def use_cache(self, cache):
+        """get_events をイベントキャッシュ経由にし、追加・更新・削除をキャッシュへ即時反映する"""
+        self.cache = cache
+        return cache
+
+    async def list_events(self, calendar_id, **params):
+        """events().list() の生レスポンス（ページング・syncToken 用）"""
+        return await self.run(self.gcal.list_events, calendar_id, **params)
+
+    async def get_events(self, calendar_id, days=7):
+        if self.cache:
+            return await self.cache.get_events(calendar_id, days=days)
+        try:
+            return await self.run(self.gcal.get_events, calendar_id, days=days)
+        except Exception:
+            return []
+
+    async def add_event(self, calendar_id, title, date_str, start_time_str=None, end_time_str=None):
+        ev = await self.run(self.gcal.add_event, calendar_id, title, date_str, start_time_str, end_time_str)
+        if self.cache: self.cache.upsert(calendar_id, ev)
+        return ev
+
+    async def update_event(self, calendar_id, event_id, title, date_str, start_time_str=None, end_time_str=None):
+        ev = await self.run(self.gcal.update_event, calendar_id, event_id, title, date_str, start_time_str, end_time_str)
+        if self.cache: self.cache.upsert(calendar_id, ev)
+        return ev
+
+    async def get_event(self, calendar_id, event_id):
+        return await self.run(self.gcal.get_event, calendar_id, event_id)
+
+    async def delete_event(self, calendar_id, event_id):
+        res = await self.run(self.gcal.delete_event, calendar_id, event_id)
+        if self.cache: self.cache.remove(calendar_id, event_id)
+        return res
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,42 @@
+import hashlib
+import json
+import discord
+
+# 前回同期したコマンドツリーのハッシュ（スコープ -> sha256）を保存するシステムデータのキー
+SYNC_KEY = "command_sync"
+
+
+def _command_dict(cmd, tree):
+    try:
+        return cmd.to_dict(tree)
+    except TypeError:
+        # discord.py 2.3 までは引数なし
+        return cmd.to_dict()
+
+
+def tree_hash(tree, guild=None):
+    """同期される内容（コマンドの JSON 表現）の SHA-256"""
+    payload = [_command_dict(cmd, tree) for cmd in tree.get_commands(guild=guild)]
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def sync_commands(bot, data_manager, dev_guild_id=None, force=False):
+    """
+    コマンドツリーが前回の同期から変わっていれば同期する（グローバル同期は遅く、回数制限も厳しいため）。
+    dev_guild_id を指定すると、そのギルドにだけ同期する（開発用。すぐに反映される）。
+    同期したら True を返す
+    """
+    guild = discord.Object(id=dev_guild_id) if dev_guild_id else None
+    if guild: bot.tree.copy_global_to(guild=guild)
+    scope = f"guild:{dev_guild_id}" if guild else "global"
+    digest = tree_hash(bot.tree, guild)
+    synced = dict(data_manager.get_system_data(SYNC_KEY, {}) or {})
+    if not force and synced.get(scope) == digest:
+        print(f"⏭️ コマンドに変更がないため同期を省略しました ({scope})")
+        return False
+    await bot.tree.sync(guild=guild)
+    synced[scope] = digest
+    data_manager.set_system_data(SYNC_KEY, synced)
+    print(f"🔄 コマンドを同期しました ({scope})")
+    return True
@@ -1,12 +1,56 @@
-import discord
+import asyncio
 import json
 import os
+import time
+from datetime import datetime, timedelta
+
+from utils.attendance_store import AttendanceBook
+from utils.metrics import metrics, BYTES_BUCKETS
+from utils.reminder_ledger import DEFAULT_MAX_ENTRIES as REMINDED_MAX
+from utils.storage import ChannelStore
+
+# ギルド以外の Bot 全体の状態を保存するキー（"_" で始まるキーはギルドとして扱わない）
+SYSTEM_KEY = "_system"
+# バックアップ先へ全体スナップショットを送る間隔（秒）
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL", str(6 * 3600)))
+# この秒数使われていないギルドの出欠記録（シャード）はメモリから外す
+SHARD_IDLE = float(os.getenv("SHARD_IDLE", "1800"))
+# 出欠パネルのメッセージを覚えておく日数（再起動後もこの期間のパネルのボタンは使える）
+BOARD_KEEP_DAYS = int(os.getenv("ATTEND_BOARD_DAYS", "14"))
+
+metrics.histogram("utool_save_seconds", "保存（スナップショット／ジャーナル）1回の所要時間")
+metrics.histogram("utool_save_bytes", "保存1回で書いたバイト数", BYTES_BUCKETS)
 
 class DataManager:
-    def __init__(self, bot, channel_id: int):
+    def __init__(self, bot, channel_id: int, save_interval=None, backend=None, backup=None):
         self.bot = bot
         self.channel_id = channel_id
         self.data = {}
+        # 保存先（既定はデータ用チャンネル）と、任意のバックアップ先
+        self.backend = backend or ChannelStore(bot, channel_id)
+        self.backup = backup
+        self._last_backup = time.monotonic()
+        # 書き込みは最短でもこの秒数おきにまとめる
+        self.save_interval = save_interval if save_interval is not None else float(os.getenv("SAVE_INTERVAL", "30"))
+        self._dirty = False
+        self._dirty_event = None
+        # 書き込みは _flush_loop（書き込み役のタスク）だけが行う。flush() はその完了を待つ
+        self._flusher = None
+        self._wake = None
+        self._flush_waiters = []
+        self._guild_locks = {}
+        self._last_write = 0.0
+        # 未書き込みのジャーナル（[op, gid, *args] のリスト）
+        self._journal = []
+        self._needs_snapshot = False
+        # 出欠記録はギルドごとのシャード。読み込み済みのギルドと最終利用時刻、未保存のギルド
+        self._shard_used = {}
+        self._dirty_shards = set()
+        # 書き込み中（まだ保存先に反映されていない）のギルド
+        self._writing_shards = set()
+        self._backup_dirty = set()
+        self.stats = {"save_requests": 0, "writes": 0, "snapshots": 0, "journal_entries": 0,
+                      "shard_loads": 0, "shard_evictions": 0}
 
     def get_guild_data(self, guild_id):
         gid = str(guild_id)
@@ -28,24 +72,371 @@ class DataManager:
         
         return self.data[gid]
 
+    def guild_items(self):
+        """(ギルドID, ギルドデータ) を列挙する（システム用のキーは除く）"""
+        return [(gid, gd) for gid, gd in self.data.items() if not gid.startswith("_")]
+
+    def get_system_data(self, name, default=None):
+        """通知済み記録など、ギルドに属さない状態の保存場所"""
+        system = self.data.setdefault(SYSTEM_KEY, {})
+        if name not in system:
+            system[name] = default if default is not None else {}
+        return system[name]
+
+    # --- ギルド単位の排他（読んでから書く操作が await をまたぐとき用） ---
+    def guild_lock(self, guild_id):
+        gid = str(guild_id)
+        if gid not in self._guild_locks:
+            self._guild_locks[gid] = asyncio.Lock()
+        return self._guild_locks[gid]
+
+    async def mutate(self, guild_id, fn):
+        """
+        ギルドのロックを取ってから fn(ギルドデータ) を呼ぶ（fn はコルーチン関数でもよい）。
+        fn の中の変更も下の set_* で行い、戻り値はそのまま返す
+        """
+        async with self.guild_lock(guild_id):
+            result = fn(self.get_guild_data(guild_id))
+            if asyncio.iscoroutine(result): result = await result
+            return result
+
+    async def record_attendance(self, guild_id, date_str, user_id, name, status):
+        """出欠を記録し、同じ日の前の回答（初回は None）を返す"""
+        async def update(gd):
+            book = await self.load_attendance_book(guild_id)
+            prev = book.status_of(date_str, user_id)
+            self.set_attendance(guild_id, date_str, user_id, name, status)
+            return prev
+        return await self.mutate(guild_id, update)
+
+    # --- 変更操作（すべてジャーナルに記録される） ---
+    def set_system_data(self, name, value):
+        self._record(["sys", None, name, value])
+
+    def set_attendance(self, guild_id, date_str, user_id, name, status):
+        self._record(["att", str(guild_id), date_str, str(user_id), name, status])
+
+    def add_calendar_id(self, guild_id, calendar_id):
+        self._record(["cal+", str(guild_id), calendar_id])
+
+    def set_reminder(self, guild_id, **fields):
+        """通知設定（enabled / channel_id / offsets など）を部分更新する"""
+        self._record(["rem", str(guild_id), fields])
+
+    def set_weather_location(self, guild_id, location):
+        """天気予報の地点 {"name", "lat", "lon"}"""
+        self._record(["wx", str(guild_id), location])
+
+    def set_trivia_packs(self, guild_id, packs):
+        self._record(["triv", str(guild_id), list(packs)])
+
+    def set_theme(self, guild_id, theme):
+        self._record(["theme", str(guild_id), theme])
+
+    def add_reminded(self, key, expires):
+        """送信済みの開始前通知を1件記録する（記録全体ではなく追加分だけをジャーナルに書く）"""
+        self._record(["remind", None, list(key), expires])
+
+    def add_attendance_board(self, guild_id, message_id, date_str):
+        """出欠パネルのメッセージ（再起動後に bot.add_view で登録し直すため）"""
+        self._record(["board", str(guild_id), str(message_id), date_str])
+
+    def _record(self, entry):
+        self._apply_entry(entry)
+        self._journal.append(entry)
+        self.mark_dirty()
+
+    def _apply_entry(self, entry):
+        """ジャーナル1件を self.data に反映する（起動時の再生でも使う。同じ操作を2回適用しても結果は同じ）"""
+        op, gid, *args = entry
+        if op == "sys":
+            self.data.setdefault(SYSTEM_KEY, {})[args[0]] = args[1]
+            return
+        if op == "remind":
+            rows = self.data.setdefault(SYSTEM_KEY, {}).setdefault("reminded", [])
+            rows.append(args[0] + [args[1]])
+            # 期限切れ（開始時刻を過ぎたもの）は先頭から捨て、件数も上限までにする
+            now, drop = time.time(), 0
+            while drop < len(rows) and rows[drop][-1] <= now: drop += 1
+            drop = max(drop, len(rows) - REMINDED_MAX)
+            if drop: del rows[:drop]
+            return
+        d = self.get_guild_data(gid)
+        if op == "att":
+            date_str, uid, name, status = args
+            self.attendance_book(gid).set(date_str, uid, name, status)
+            self._dirty_shards.add(gid)
+            self._backup_dirty.add(gid)
+        elif op == "cal+":
+            cids = d.setdefault("calendar_ids", [])
+            if args[0] not in cids: cids.append(args[0])
+        elif op == "rem":
+            d.setdefault("reminder", {"enabled": False, "channel_id": None}).update(args[0])
+        elif op == "wx":
+            d["weather_location"] = args[0]
+        elif op == "triv":
+            d["trivia_packs"] = args[0]
+        elif op == "theme":
+            d["theme"] = args[0]
+        elif op == "board":
+            boards = d.setdefault("attendance_boards", {})
+            boards[args[0]] = args[1]
+            # 古いパネルは忘れる（再生しても同じ結果になるよう、記録したパネルの日付を基準にする）
+            cutoff = (datetime.strptime(args[1], '%Y-%m-%d') - timedelta(days=BOARD_KEEP_DAYS)).strftime('%Y-%m-%d')
+            for mid in [m for m, day in boards.items() if day < cutoff]:
+                del boards[mid]
+        else:
+            print(f"❌ 不明なジャーナル操作: {op}")
+
+    # --- 読み込み（最新スナップショット + それ以降のジャーナルを再生） ---
     async def load_files(self):
-        if not self.channel_id: return
-        channel = self.bot.get_channel(self.channel_id)
-        if not channel: return
-        async for msg in channel.history(limit=5):
-            for att in msg.attachments:
-                if att.filename == "data.json":
-                    try:
-                        text = await att.read()
-                        self.data = json.loads(text.decode("utf-8"))
-                        print("✅ データの復元に成功しました")
-                        return
-                    except: print("❌ ロード失敗")
+        t0 = time.perf_counter()
+        try:
+            snapshot, entries = await self.backend.load()
+            restored = False
+            if snapshot is None and not entries and self.backup:
+                # 保存先が空（新しいディスクなど）ならバックアップから復元し、保存先に全体を書き込む
+                snapshot, entries = await self.backup.load()
+                restored = snapshot is not None or bool(entries)
+            t1 = time.perf_counter()
+            if snapshot is not None:
+                # 形式が違うものは読み込まない（そのまま書き戻して本来のデータを上書きしないように）
+                if not isinstance(snapshot, dict) or not all(isinstance(gd, dict) for gd in snapshot.values()):
+                    raise ValueError("スナップショットの形式が正しくありません")
+                self.data = snapshot
+                # 旧形式（出欠記録がスナップショットに入っている）ならここで圧縮形式に移し、
+                # 次の書き込みでギルドごとのシャードに分ける
+                legacy = [gid for gid, gd in self.guild_items() if "attendance" in gd]
+                for gid in legacy:
+                    self.attendance_book(gid)
+                    self._dirty_shards.add(gid)
+                if legacy: await self.save_all()
+            if restored:
+                # 出欠記録も保存先に書くので、ジャーナルの再生より前にバックアップのシャードを全部読んでおく
+                await self._load_backup_shards()
+            # 出欠の記録を再生するギルドのシャードだけ先に読んでおく（それ以外はギルドが使われたときに読む）
+            for gid in dict.fromkeys(e[1] for e in entries if e[0] == "att"):
+                await self.load_attendance_book(gid)
+            for entry in entries:
+                self._apply_entry(entry)
+            if restored:
+                await self.save_all()
+                print("📥 保存先が空だったため、バックアップから復元しました")
+            if snapshot is not None or entries:
+                print(f"✅ データの復元に成功しました（ジャーナル {len(entries)} 件を再生）")
+            self._log_load_timings(t0, t1, time.perf_counter())
+        except Exception as e: print(f"❌ ロード失敗: {e}")
+
+    async def _load_backup_shards(self):
+        """バックアップ先の出欠記録を全ギルド分メモリに読み、次の書き込みで保存先へ書く"""
+        for gid, gd in self.guild_items():
+            if gd.get("attendance") is None:
+                gd["attendance"] = await self.backup.fetch_shard(gid) or AttendanceBook()
+            self.attendance_book(gid)
+            self._dirty_shards.add(gid)
+
+    def _log_load_timings(self, t0, t1, t2):
+        """起動時ロードの内訳を表示する"""
+        parts = []
+        for name, v in getattr(self.backend, "timings", {}).items():
+            parts.append(f"{name}={v}" if isinstance(v, bool) else f"{name}={v * 1000:.0f}ms")
+        parts.append(f"replay={(t2 - t1) * 1000:.0f}ms")
+        print(f"⏱️ データ読み込み {(t2 - t0) * 1000:.0f}ms ({', '.join(parts)})")
+
+    # --- 問い合わせ ---
+    def attendance_book(self, guild_id):
+        """
+        ギルドの出欠記録（AttendanceBook）。メモリになければ保存先のシャードから同期で読み込む。
+        旧形式の dict が入っていれば変換して置き換える（イベントループ上では load_attendance_book() を使う）
+        """
+        gid = str(guild_id)
+        d = self.get_guild_data(gid)
+        book = d.get("attendance")
+        if book is None:
+            self.stats["shard_loads"] += 1
+            book = d["attendance"] = self.backend.load_shard(gid) or AttendanceBook()
+            self.evict_idle()
+        elif not isinstance(book, AttendanceBook):
+            book = d["attendance"] = AttendanceBook.from_json(book)
+        self._shard_used[gid] = time.monotonic()
+        return book
+
+    async def load_attendance_book(self, guild_id):
+        """
+        attendance_book() の非同期版。メモリになければシャードをワーカースレッドで読む
+        （ボタンやコマンドなど、イベントループ上の処理からはこちらを使う）
+        """
+        gid = str(guild_id)
+        if self.data.get(gid, {}).get("attendance") is None:
+            book = await self.backend.fetch_shard(gid)
+            d = self.get_guild_data(gid)
+            # 読んでいる間に他の処理が読み込んでいたらそちらを使う
+            if d.get("attendance") is None:
+                self.stats["shard_loads"] += 1
+                d["attendance"] = book or AttendanceBook()
+                self.evict_idle()
+        return self.attendance_book(gid)
+
+    async def _read_shard(self, gid):
+        """バックアップ用。メモリにあればそれを、なければ保存先から読む（メモリには残さない）"""
+        book = self.data.get(gid, {}).get("attendance")
+        return book if book is not None else await self.backend.fetch_shard(gid)
+
+    def evict_idle(self, max_idle=None):
+        """しばらく使われていない、保存済みのシャードをメモリから外す"""
+        max_idle = SHARD_IDLE if max_idle is None else max_idle
+        now = time.monotonic()
+        for gid, used in list(self._shard_used.items()):
+            if now - used < max_idle or gid in self._dirty_shards or gid in self._writing_shards: continue
+            self.data.get(gid, {}).pop("attendance", None)
+            del self._shard_used[gid]
+            self.stats["shard_evictions"] += 1
+
+    def _loaded_book(self, gid):
+        """
+        メモリにある出欠記録（未保存の変更も反映済み）。なければ None。
+        未保存・書き込み中の変更があるギルドはメモリから外さないので、None なら保存先が最新
+        """
+        if self.data.get(gid, {}).get("attendance") is None: return None
+        return self.attendance_book(gid)
+
+    async def attendance_rows(self, guild_id, date_str=None):
+        """出欠記録を (日付, ユーザーID, 名前, ステータス) の日付順リストで返す"""
+        gid = str(guild_id)
+        if self.backend.supports_queries:
+            # メモリにあればそこから返し、なければインデックス付きの保存先に問い合わせる（書き込みは待たない）
+            book = self._loaded_book(gid)
+            if book is None: return await self.backend.query_attendance(gid, date_str)
+            return book.rows(date_str)
+        return (await self.load_attendance_book(gid)).rows(date_str)
+
+    def memory_usage(self):
+        """メトリクス用の概算: (ギルド数, 読み込み済みシャード数, 出欠件数, おおよそのバイト数)"""
+        guilds = self.guild_items()
+        books = [gd["attendance"] for _, gd in guilds if isinstance(gd.get("attendance"), AttendanceBook)]
+        config_bytes = sum(len(json.dumps({k: v for k, v in gd.items() if k != "attendance"}, ensure_ascii=False, default=str))
+                           for _, gd in guilds)
+        return len(guilds), len(books), sum(len(b) for b in books), config_bytes + sum(b.nbytes() for b in books)
+
+    async def iter_attendance(self, guild_id, since=None, until=None):
+        """
+        書き出し用。since〜until の出欠記録を1行ずつ返すイテレーター。
+        別スレッドで読み進めてよいように、メモリ上の記録は呼んだ時点の写しから返し、SQLite は少しずつ読む
+        """
+        gid = str(guild_id)
+        if self.backend.supports_queries:
+            book = self._loaded_book(gid)
+            if book is None: return self.backend.stream_attendance(gid, since=since, until=until)
+            return book.frozen_rows(since, until)
+        return (await self.load_attendance_book(gid)).frozen_rows(since, until)
+
+    # --- 保存（変更は dirty にしておき、バックグラウンドでまとめて書き込む） ---
+    def mark_dirty(self):
+        self._dirty = True
+        self.stats["save_requests"] += 1
+        self._ensure_flusher()
+        self._dirty_event.set()
 
     async def save_all(self):
-        channel = self.bot.get_channel(self.channel_id)
-        if not channel: return
-        filename = "data.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
-        await channel.send(file=discord.File(filename))
\ No newline at end of file
+        """
+        self.data を直接書き換えたあとの保存予約（次回は全体スナップショットを書く）。
+        確実に書き込みたいときは flush() を使う
+        """
+        self._needs_snapshot = True
+        self.mark_dirty()
+
+    def _ensure_flusher(self):
+        if self._dirty_event is None:
+            self._dirty_event = asyncio.Event()
+            self._wake = asyncio.Event()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """書き込み役。変更をまとめて1つずつ書き込み、flush() で待っている呼び出し元に結果を返す"""
+        while True:
+            await self._dirty_event.wait()
+            wait = self._last_write + self.save_interval - time.monotonic()
+            if wait > 0 and not self._wake.is_set():
+                # flush() が呼ばれたら待たずに書く
+                try: await asyncio.wait_for(self._wake.wait(), wait)
+                except asyncio.TimeoutError: pass
+            self._dirty_event.clear()
+            self._wake.clear()
+            waiters, self._flush_waiters = self._flush_waiters, []
+            try:
+                await self._write()
+                self.evict_idle()
+            except Exception as e:
+                print(f"❌ 保存失敗: {e}")
+                for fut in waiters:
+                    if not fut.done(): fut.set_exception(e)
+                # 次の間隔でもう一度試す
+                self._last_write = time.monotonic()
+                self._dirty_event.set()
+                continue
+            for fut in waiters:
+                if not fut.done(): fut.set_result(None)
+
+    async def flush(self):
+        """未保存の変更を書き込み役に今すぐ書かせ、書き終わるまで待つ"""
+        self._ensure_flusher()
+        fut = asyncio.get_running_loop().create_future()
+        self._flush_waiters.append(fut)
+        self._wake.set()
+        self._dirty_event.set()
+        await fut
+
+    async def _write(self):
+        """未保存の変更があれば書き込む（_flush_loop からだけ呼ぶ）"""
+        if not self._dirty: return
+        self._dirty = False
+        entries, self._journal = self._journal, []
+        shards, self._dirty_shards = self._dirty_shards, set()
+        compact = self._needs_snapshot or self.backend.should_compact(len(entries))
+        started = time.perf_counter()
+        self._writing_shards = shards
+        try:
+            if compact:
+                self._needs_snapshot = False
+                # シャードは変更のあったギルドの分だけ書き直される
+                await self.backend.write_snapshot(self.data, shards, self._read_shard)
+                self.stats["snapshots"] += 1
+            elif entries:
+                await self.backend.append_journal(entries, self.data)
+                self.stats["journal_entries"] += len(entries)
+                if not self.backend.journal_covers_shards:
+                    # 出欠はまだジャーナルにしかないので、次のスナップショットまでメモリに残す
+                    self._dirty_shards |= shards
+        except Exception:
+            self._journal = entries + self._journal
+            self._dirty_shards |= shards
+            self._needs_snapshot = self._needs_snapshot or compact
+            self._dirty = True
+            raise
+        finally:
+            self._writing_shards = set()
+        self._last_write = time.monotonic()
+        self.stats["writes"] += 1
+        if compact or entries:
+            kind = "snapshot" if compact else "journal"
+            metrics.observe("utool_save_seconds", time.perf_counter() - started, kind=kind)
+            metrics.observe("utool_save_bytes", self.backend.last_write_bytes, kind=kind)
+        if self.backup and time.monotonic() - self._last_backup >= BACKUP_INTERVAL:
+            await self._write_backup()
+
+    async def _write_backup(self):
+        shards, self._backup_dirty = self._backup_dirty, set()
+        try:
+            await self.backup.write_snapshot(self.data, shards, self._read_shard)
+            self._last_backup = time.monotonic()
+        except Exception as e:
+            self._backup_dirty |= shards
+            print(f"❌ バックアップ失敗: {e}")
+
+    async def close(self):
+        """終了前に未保存分を書き出す"""
+        await self.flush()
+        # 書き込み役を止めてからバックアップする（同時に書くものがいないように）
+        if self._flusher: self._flusher.cancel()
+        if self.backup: await self._write_backup()
\ No newline at end of file
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+# 朝の定期連絡を同時に送るチャンネル数の上限
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "10"))
+
+
+class DeliveryTracker:
+    """
+    ギルドごとの定期連絡の配信状態（最後に届けた日付）と配信遅延。
+    出欠パネルは本文とは別に記録し、パネルだけ失敗したときは本文を送り直さない
+    """
+    def __init__(self, state=None, panels=None):
+        self.state = dict(state or {})   # gid -> 'YYYY-MM-DD'
+        self.panels = dict(panels or {}) # gid -> 出欠パネルを届けた 'YYYY-MM-DD'
+        self.latencies = {}              # gid -> 直近の配信遅延（秒）
+
+    def delivered(self, gid, day):
+        return self.state.get(gid) == day
+
+    def panel_delivered(self, gid, day):
+        return self.panels.get(gid) == day
+
+    def pending(self, gid, day, with_panel):
+        """本文か（with_panel なら）出欠パネルがまだ届いていないか"""
+        return not self.delivered(gid, day) or (with_panel and not self.panel_delivered(gid, day))
+
+    def mark(self, gid, day, latency):
+        self.state[gid] = day
+        self.latencies[gid] = latency
+
+    def mark_panel(self, gid, day):
+        self.panels[gid] = day
+
+    def summary(self):
+        if not self.latencies: return "配信なし"
+        vals = sorted(self.latencies.values())
+        return f"{len(vals)} ギルド, 中央値 {vals[len(vals) // 2]:.2f}s, 最大 {vals[-1]:.2f}s"
+
+
+async def fan_out(jobs, limit=DIGEST_CONCURRENCY):
+    """コルーチンを最大 limit 個ずつ並行に実行する（例外は結果として返す）"""
+    sem = asyncio.Semaphore(limit)
+
+    async def run(job):
+        async with sem:
+            return await job
+
+    return await asyncio.gather(*(run(j) for j in jobs), return_exceptions=True)
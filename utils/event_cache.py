@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone, timedelta
+
+JST = timezone(timedelta(hours=9))
+# 全件取得で取ってくる期間（日）。定期連絡の7日分 + 最も早い開始前通知の分だけ先まで取る
+DEFAULT_HORIZON_DAYS = 7
+
+
+def event_start(e):
+    """イベントの開始日時（終日予定は JST の 0:00）を datetime で返す"""
+    return _parse_point(e.get('start', {}))
+
+
+def event_end(e):
+    end = e.get('end')
+    return _parse_point(end) if end else event_start(e)
+
+
+def _parse_point(p):
+    st = p.get('dateTime')
+    if st:
+        return datetime.fromisoformat(st.replace('Z', '+00:00')).astimezone(JST)
+    return datetime.strptime(p.get('date', '1970-01-01'), '%Y-%m-%d').replace(tzinfo=JST)
+
+
+def _is_gone(e):
+    """syncToken 失効 (HTTP 410 Gone) かどうか"""
+    resp = getattr(e, 'resp', None)
+    return getattr(resp, 'status', None) == 410
+
+
+class _CalendarState:
+    def __init__(self):
+        self.events = {}       # event_id -> event
+        self.sync_token = None
+        self.synced_at = 0.0   # monotonic
+        self.synced_wall = None
+        self.day = None        # フル同期した日付（日付が変わったら取り直す）
+        self.lock = asyncio.Lock()
+
+
+class CalendarEventCache:
+    """
+    カレンダーごとのイベントキャッシュ。
+    初回（と日付が変わったとき）だけ今日から horizon 日先までの一覧を取得し、
+    以降は syncToken（なければ updatedMin）で差分だけを取り込む。
+    get_events(days=N) はメモリ上のイベントから期間で絞り込んで返す。
+    """
+    def __init__(self, calendar, ttl=None):
+        self.calendar = calendar
+        # この秒数以内に同期済みなら API を呼ばずにメモリから返す
+        self.ttl = ttl if ttl is not None else float(os.getenv("GCAL_CACHE_TTL", "55"))
+        self._states = {}
+        # 変更通知先 listener(cid, event, removed)
+        self.listeners = []
+        # 通知オフセットの最大値（分）。全件取得の期間をこの分だけ延ばす
+        self.lookahead = 0
+        self.stats = {"full_syncs": 0, "delta_syncs": 0, "hits": 0, "resyncs_410": 0}
+
+    @property
+    def horizon(self):
+        return timedelta(days=DEFAULT_HORIZON_DAYS, minutes=self.lookahead)
+
+    def set_lookahead(self, minutes):
+        """通知オフセットの最大値を設定する。期間が延びたら次の同期で全件取り直す"""
+        if minutes > self.lookahead:
+            for state in self._states.values():
+                state.day = None
+        self.lookahead = minutes
+
+    def _window(self, now):
+        """全件取得する期間 (timeMin, timeMax)"""
+        time_min = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return time_min.isoformat(), (time_min + timedelta(days=1) + self.horizon).isoformat()
+
+    def _state(self, cid):
+        if cid not in self._states:
+            self._states[cid] = _CalendarState()
+        return self._states[cid]
+
+    async def refresh(self, cid, force=False):
+        """キャッシュが古ければ差分同期する（同じカレンダーへの同時呼び出しは1回にまとまる）"""
+        state = self._state(cid)
+        async with state.lock:
+            today = datetime.now(JST).strftime('%Y-%m-%d')
+            if not force and state.day == today and time.monotonic() - state.synced_at < self.ttl:
+                self.stats["hits"] += 1
+                return
+            if state.day != today or (state.sync_token is None and state.synced_wall is None):
+                await self._full_sync(cid, state)
+                return
+            try:
+                await self._delta_sync(cid, state)
+            except Exception as e:
+                if not _is_gone(e): raise
+                # syncToken が失効したら全件取り直し
+                self.stats["resyncs_410"] += 1
+                await self._full_sync(cid, state)
+
+    async def _list_all(self, cid, **params):
+        items, page_token, sync_token = [], None, None
+        while True:
+            if page_token: params["pageToken"] = page_token
+            res = await self.calendar.list_events(cid, **params) or {}
+            items.extend(res.get('items', []))
+            page_token = res.get('nextPageToken')
+            if not page_token:
+                sync_token = res.get('nextSyncToken')
+                break
+        return items, sync_token
+
+    async def _full_sync(self, cid, state):
+        now = datetime.now(JST)
+        # 無期限に繰り返す予定が何年分も展開されないよう、期間を区切って取る
+        time_min, time_max = self._window(now)
+        items, token = await self._list_all(cid, timeMin=time_min, timeMax=time_max, singleEvents=True, maxResults=2500)
+        old, state.events = state.events, {e['id']: e for e in items if e.get('status') != 'cancelled'}
+        for eid, e in old.items():
+            if eid not in state.events: self._notify(cid, e, True)
+        for eid, e in state.events.items():
+            if old.get(eid) != e: self._notify(cid, e, False)
+        state.sync_token = token
+        state.day = now.strftime('%Y-%m-%d')
+        self._mark_synced(state, now)
+        self.stats["full_syncs"] += 1
+
+    async def _delta_sync(self, cid, state):
+        now = datetime.now(JST)
+        if state.sync_token:
+            items, token = await self._list_all(cid, syncToken=state.sync_token, singleEvents=True)
+        else:
+            # syncToken が返ってこないカレンダーは更新時刻で差分を取る
+            time_min, time_max = self._window(now)
+            items, token = await self._list_all(
+                cid, updatedMin=state.synced_wall.isoformat(), timeMin=time_min, timeMax=time_max,
+                singleEvents=True, showDeleted=True, maxResults=2500)
+        for e in items:
+            self._apply(cid, state, e)
+        if token: state.sync_token = token
+        self._mark_synced(state, now)
+        self.stats["delta_syncs"] += 1
+
+    def _mark_synced(self, state, now):
+        state.synced_at = time.monotonic()
+        state.synced_wall = now
+
+    def _apply(self, cid, state, e):
+        if e.get('status') == 'cancelled':
+            old = state.events.pop(e['id'], None)
+            if old: self._notify(cid, old, True)
+        elif state.events.get(e['id']) != e:
+            state.events[e['id']] = e
+            self._notify(cid, e, False)
+
+    def _notify(self, cid, event, removed):
+        for listener in self.listeners:
+            try:
+                listener(cid, event, removed)
+            except Exception as e:
+                print(f"❌ キャッシュ変更通知エラー: {e}")
+
+    # --- 手元での更新を即座に反映 ---
+    def upsert(self, cid, event):
+        if cid in self._states and event and 'id' in event:
+            self._apply(cid, self._states[cid], event)
+
+    def remove(self, cid, event_id):
+        if cid in self._states:
+            self._apply(cid, self._states[cid], {'id': event_id, 'status': 'cancelled'})
+
+    def cached_events(self, cid, days=7):
+        """同期は行わず、手元のイベントを期間で絞り込んで開始順に返す"""
+        state = self._states.get(cid)
+        if not state: return []
+        now = datetime.now(JST)
+        time_min = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        time_max = (now + timedelta(days=days)).replace(hour=23, minute=59, second=59)
+        evs = []
+        for e in state.events.values():
+            try:
+                if event_end(e) > time_min and event_start(e) < time_max:
+                    evs.append(e)
+            except (KeyError, ValueError):
+                continue
+        evs.sort(key=event_start)
+        return evs
+
+    async def get_events(self, cid, days=7):
+        try:
+            await self.refresh(cid)
+        except Exception as e:
+            # 同期に失敗しても手元のデータがあればそれを返す
+            print(f"❌ カレンダー同期エラー ({cid}): {e}")
+        return self.cached_events(cid, days)
@@ -0,0 +1,46 @@
+import asyncio
+
+# 全ループ通算の取得回数（重複排除でどれだけ節約できたか）
+fetch_stats = {"plans": 0, "requested": 0, "fetched": 0, "saved": 0}
+
+
+class FetchPlan:
+    """
+    1回のループで取得するカレンダーIDの一覧。
+    複数ギルドが同じカレンダーを登録していても1回だけ取得し、結果を各ギルドへ配る。
+    """
+    def __init__(self, guild_calendars):
+        # guild_calendars: (gid, [calendar_id, ...]) のイテラブル
+        self.subscribers = {}  # calendar_id -> [gid, ...]
+        self.guilds = {}       # gid -> [calendar_id, ...]
+        for gid, cids in guild_calendars:
+            uniq = list(dict.fromkeys(cids))
+            self.guilds[gid] = uniq
+            for cid in uniq:
+                self.subscribers.setdefault(cid, []).append(gid)
+
+    @property
+    def requested(self):
+        """ギルドごとに取得していた場合の回数"""
+        return sum(len(cids) for cids in self.guilds.values())
+
+    @property
+    def saved(self):
+        return self.requested - len(self.subscribers)
+
+    async def fetch(self, calendar, days=7):
+        """各カレンダーを1回ずつ並行取得し {calendar_id: events} を返す"""
+        cids = list(self.subscribers)
+        results = await asyncio.gather(*(calendar.get_events(cid, days=days) for cid in cids))
+        fetch_stats["plans"] += 1
+        fetch_stats["requested"] += self.requested
+        fetch_stats["fetched"] += len(cids)
+        fetch_stats["saved"] += self.saved
+        return dict(zip(cids, results))
+
+    def events_for(self, gid, results):
+        """取得結果からギルドが購読しているカレンダー分をまとめて返す"""
+        evs = []
+        for cid in self.guilds.get(gid, []):
+            evs.extend(results.get(cid, []))
+        return evs
@@ -0,0 +1,200 @@
+import contextlib
+import contextvars
+import cProfile
+import functools
+import os
+import random
+import re
+import time
+import discord
+from discord import app_commands, ui
+from utils.metrics import metrics
+
+# 処理に PROFILE_SLOW_MS ミリ秒以上かかった操作・ループ1周の cProfile 結果を PROFILE_DIR に書き出す（0 なら無効）
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# 有効なときに実際にプロファイルを取る割合（計測自体のオーバーヘッドを抑える）
+PROFILE_SAMPLE = float(os.getenv("PROFILE_SAMPLE", "1.0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+# Discord はインタラクションから3秒以内に最初の応答（defer を含む）がないと失敗扱いにする
+RESPONSE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 2.5, 3, 5, 10)
+RESPONSE_METHODS = ("send_message", "defer", "edit_message", "send_modal")
+
+# いま処理しているハンドラーの名前（応答メソッドの計測でラベルに使う）
+_handler = contextvars.ContextVar("utool_handler", default=None)
+
+
+class SlowProfiler:
+    """
+    遅い操作だけを cProfile で記録する。
+    cProfile はスレッド全体を見るため、await している間に走った他のタスクも一緒に記録される。
+    同時に有効にできるプロファイラは1つなので、計測中に来た分は取らずに流す（サンプリング）
+    """
+    def __init__(self, threshold_ms=PROFILE_SLOW_MS, directory=PROFILE_DIR, sample=PROFILE_SAMPLE, keep=PROFILE_KEEP):
+        self.threshold = threshold_ms / 1000
+        self.directory = directory
+        self.sample = sample
+        self.keep = keep
+        self.busy = False
+        self.dumps = 0
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def start(self):
+        if not self.enabled or self.busy or random.random() >= self.sample: return None
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # 他のプロファイラ（デバッガなど）が動いている
+            return None
+        self.busy = True
+        return prof
+
+    def finish(self, prof, name, seconds):
+        if prof is None: return None
+        prof.disable()
+        self.busy = False
+        if seconds < self.threshold: return None
+        os.makedirs(self.directory, exist_ok=True)
+        safe = re.sub(r"[^\w.-]+", "_", name)
+        self.dumps += 1
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.dumps:04d}_{safe}_{seconds * 1000:.0f}ms.prof")
+        prof.dump_stats(path)
+        self._prune()
+        print(f"🐢 {name} に {seconds * 1000:.0f}ms かかりました。プロファイル: {path}")
+        return path
+
+    def _prune(self):
+        files = sorted(f for f in os.listdir(self.directory) if f.endswith(".prof"))
+        for f in files[:max(0, len(files) - self.keep)]:
+            try: os.remove(os.path.join(self.directory, f))
+            except OSError: pass
+
+    @contextlib.asynccontextmanager
+    async def profile(self, name):
+        prof = self.start()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.finish(prof, name, time.perf_counter() - started)
+
+
+profiler = SlowProfiler()
+
+
+def _interaction_of(args):
+    for a in args:
+        if isinstance(a, discord.Interaction): return a
+    return None
+
+
+def record_failure(exc, handler=None):
+    """ハンドラー内で握りつぶしている例外も失敗として数える"""
+    name = handler or _handler.get() or "unknown"
+    metrics.inc("utool_interaction_failures_total", help_text="インタラクション処理で起きた例外",
+                handler=name, error=type(exc).__name__)
+
+
+def track(name, fn):
+    """コマンド・ボタン・モーダルの処理を包み、処理時間・失敗・未応答を記録する"""
+    if getattr(fn, "_utool_tracked", False): return fn
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = _handler.set(name)
+        started = time.perf_counter()
+        metrics.inc("utool_interactions_total", help_text="処理したインタラクション数", handler=name)
+        try:
+            async with profiler.profile(f"interaction:{name}"):
+                return await fn(*args, **kwargs)
+        except Exception as e:
+            record_failure(e, name)
+            raise
+        finally:
+            metrics.observe("utool_interaction_handler_seconds", time.perf_counter() - started, handler=name)
+            it = _interaction_of(args)
+            if it is not None and not it.response.is_done():
+                metrics.inc("utool_interaction_unanswered_total", help_text="応答しないまま終わったインタラクション", handler=name)
+            _handler.reset(token)
+
+    wrapper._utool_tracked = True
+    return wrapper
+
+
+def _fallback_name(it):
+    cmd = getattr(it, "command", None)
+    return cmd.qualified_name if cmd else it.type.name
+
+
+def _wrap_response(kind, original):
+    @functools.wraps(original)
+    async def wrapper(self, *args, **kwargs):
+        first = not self.is_done()
+        result = await original(self, *args, **kwargs)
+        if first:
+            it = self._parent
+            name = _handler.get() or _fallback_name(it)
+            latency = max(0.0, (discord.utils.utcnow() - it.created_at).total_seconds())
+            metrics.observe("utool_interaction_first_response_seconds", latency, handler=name, kind=kind)
+            if kind == "defer":
+                metrics.inc("utool_interaction_defers_total", help_text="3秒以内に返せず defer したインタラクション", handler=name)
+        return result
+    return wrapper
+
+
+def _callback_name(view, item):
+    cb = item.callback
+    cb = getattr(cb, "callback", None) or getattr(cb, "func", None) or cb
+    return f"{type(view).__name__}.{getattr(cb, '__name__', type(item).__name__)}"
+
+
+def install():
+    """
+    discord.py にフックを入れる（起動時に1回）。
+      - 最初の応答（send_message / defer / edit_message / send_modal）までの時間と defer の回数
+      - View のボタン・セレクト、Modal の on_submit は最初に呼ばれたときに track で包む
+    後から callback を代入する使い捨ての ui.View も対象になる
+    """
+    if getattr(discord.InteractionResponse, "_utool_instrumented", False): return
+    metrics.histogram("utool_interaction_first_response_seconds", "インタラクションから最初の応答までの時間", RESPONSE_BUCKETS)
+    metrics.histogram("utool_interaction_handler_seconds", "コマンド・ボタン・モーダルの処理時間")
+
+    for kind in RESPONSE_METHODS:
+        setattr(discord.InteractionResponse, kind, _wrap_response(kind, getattr(discord.InteractionResponse, kind)))
+    discord.InteractionResponse._utool_instrumented = True
+
+    view_task = getattr(ui.View, "_scheduled_task", None)
+    modal_task = getattr(ui.Modal, "_scheduled_task", None)
+    if view_task is None or modal_task is None:
+        print("⚠️ この discord.py ではボタン・モーダルの計測を組み込めません（コマンドのみ計測します）")
+        return
+
+    @functools.wraps(view_task)
+    async def scheduled_view_task(self, item, interaction):
+        if not getattr(item.callback, "_utool_tracked", False):
+            item.callback = track(_callback_name(self, item), item.callback)
+        return await view_task(self, item, interaction)
+
+    @functools.wraps(modal_task)
+    async def scheduled_modal_task(self, *args, **kwargs):
+        if not getattr(self.on_submit, "_utool_tracked", False):
+            self.on_submit = track(f"{type(self).__name__}.on_submit", self.on_submit)
+        return await modal_task(self, *args, **kwargs)
+
+    ui.View._scheduled_task = scheduled_view_task
+    ui.Modal._scheduled_task = scheduled_modal_task
+
+
+def instrument_tree(tree):
+    """登録済みのスラッシュコマンドをすべて track で包む（コマンド登録の後、同期の前に呼ぶ）"""
+    count = 0
+    for cmd in tree.walk_commands():
+        if isinstance(cmd, app_commands.Command) and not getattr(cmd._callback, "_utool_tracked", False):
+            cmd._callback = track(f"/{cmd.qualified_name}", cmd._callback)
+            count += 1
+    return count
@@ -1,61 +1,167 @@
 import os
+import re
+import time
 import discord
+from collections import namedtuple
 from datetime import datetime, timezone, timedelta
+from html.parser import HTMLParser
+from types import MappingProxyType
 
 JST = timezone(timedelta(hours=9))
+# テンプレート・CSS の更新確認（stat）をこの秒数より頻繁には行わない
+CHECK_INTERVAL = 60
+
+# style.css と notification.html から組み立てた、レンダリング用の不変なレイアウト
+CompiledLayout = namedtuple("CompiledLayout", [
+    "css_vars", "border", "color", "title", "weather_label", "trivia_label",
+    "schedule_label", "weekly_label", "footer",
+])
+
+DEFAULT_SECTIONS = {
+    "title": "📅 {{ date }} の定期連絡",
+    "weather": "🌡️ 天気",
+    "trivia": "💡 雑学",
+    "labels": ["▽ 今日の予定", "▽ 今週の予定"],
+    "footer": "by Utool",
+}
+
+
+def parse_css_vars(text):
+    """CSS のカスタムプロパティ（--name: value;）を dict にする（コメント /* */ は除外）"""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    return {m.group(1): m.group(2).strip().strip('"') for m in re.finditer(r"(--[\w-]+)\s*:\s*([^;]+);", text)}
+
+
+class _SectionParser(HTMLParser):
+    """notification.html から class ごとのテキストを拾う"""
+    def __init__(self):
+        super().__init__()
+        self.texts = {}
+        self._stack = []
+
+    def handle_starttag(self, tag, attrs):
+        self._stack.append((dict(attrs).get("class") or tag).split()[0])
+
+    def handle_endtag(self, tag):
+        if self._stack: self._stack.pop()
+
+    def handle_data(self, data):
+        if self._stack and data.strip():
+            self.texts.setdefault(self._stack[-1], []).append(data.strip())
+
+
+def parse_sections(text):
+    p = _SectionParser()
+    p.feed(text)
+    sections = dict(DEFAULT_SECTIONS)
+    if p.texts.get("title"): sections["title"] = p.texts["title"][0]
+    # "🌡️ 天気: {{ weather }}" のラベル部分だけを使う
+    if p.texts.get("weather"): sections["weather"] = p.texts["weather"][0].split(":")[0].strip()
+    if p.texts.get("trivia"): sections["trivia"] = p.texts["trivia"][0].split(":")[0].strip()
+    if len(p.texts.get("section-label", [])) >= 2: sections["labels"] = p.texts["section-label"][:2]
+    footer = (p.texts.get("p") or [""])[0]
+    if footer and "{{" not in footer: sections["footer"] = footer
+    return sections
+
+
+class _ThemeSource:
+    """テーマ1つ分のファイル。更新時刻が変わったときだけコンパイルし直す"""
+    def __init__(self, css_path, html_path):
+        self.css_path = css_path
+        self.html_path = html_path
+        self.mtimes = None
+        self.compiled = None
+        self.checked_at = None
+
+    def _stat(self):
+        return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in (self.css_path, self.html_path))
+
+    def get(self):
+        now = time.monotonic()
+        if self.compiled and now - self.checked_at < CHECK_INTERVAL:
+            return self.compiled
+        self.checked_at = now
+        mtimes = self._stat()
+        if mtimes != self.mtimes or self.compiled is None:
+            self.compiled = self._compile()
+            self.mtimes = mtimes
+        return self.compiled
+
+    def _read(self, path):
+        if not os.path.exists(path): return ""
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _compile(self):
+        css = parse_css_vars(self._read(self.css_path))
+        sections = parse_sections(self._read(self.html_path)) if os.path.exists(self.html_path) else DEFAULT_SECTIONS
+        return CompiledLayout(
+            css_vars=MappingProxyType(css),
+            border=css.get("--border-style", "━━━━━━━━━━━━━━━━"),
+            color=int(css.get("--primary-color", "#5865f2").replace("#", ""), 16),
+            title=sections["title"],
+            weather_label=sections["weather"],
+            trivia_label=sections["trivia"],
+            schedule_label=sections["labels"][0],
+            weekly_label=sections["labels"][1],
+            footer=sections["footer"],
+        )
+
 
 class HTMLLayoutEngine:
     def __init__(self):
         self.template_dir = "templates"
         self.css_path = os.path.join(self.template_dir, "style.css")
         self.html_path = os.path.join(self.template_dir, "notification.html")
+        # テーマごとの上書き: templates/themes/<名前>/style.css（notification.html は任意）
+        self.theme_dir = os.path.join(self.template_dir, "themes")
+        self._default = _ThemeSource(self.css_path, self.html_path)
+        self._themes = {}
 
-    def _get_css_var(self, var_name, default):
-        """CSSファイルから変数の値を取得（コメント /* */ を正しく除外する）"""
-        if not os.path.exists(self.css_path): return default
-        with open(self.css_path, "r", encoding="utf-8") as f:
-            for line in f:
-                if var_name in line:
-                    # 1. ":" より後ろを取得
-                    value = line.split(":")[1]
-                    # 2. "/*" があれば、それより前だけを使う
-                    value = value.split("/*")[0]
-                    # 3. セミコロン、引用符、前後の空白を削除
-                    return value.replace(";", "").strip().strip('"')
-        return default
-
-    def build_embed(self, data, genres_config):
+    def available_themes(self):
+        if not os.path.isdir(self.theme_dir): return []
+        return sorted(n for n in os.listdir(self.theme_dir) if os.path.isdir(os.path.join(self.theme_dir, n)))
+
+    def compiled(self, theme=None):
+        """テーマのコンパイル済みレイアウト（存在しないテーマは既定のもの）"""
+        if not theme: return self._default.get()
+        if theme not in self._themes:
+            base = os.path.join(self.theme_dir, theme)
+            if not os.path.isdir(base): return self._default.get()
+            html = os.path.join(base, "notification.html")
+            self._themes[theme] = _ThemeSource(os.path.join(base, "style.css"), html if os.path.exists(html) else self.html_path)
+        return self._themes[theme].get()
+
+    def build_embed(self, data, genres_config, theme=None):
         """
-        HTML/CSSの構成を元に、Discord Embedを組み立てる
+        コンパイル済みの HTML/CSS 構成を元に、Discord Embed を組み立てる
         """
-        # CSSからデザイン設定を読み込む
-        border = self._get_css_var("--border-style", "━━━━━━━━━━━━━━━━")
-        color_hex = self._get_css_var("--primary-color", "#5865f2").replace("#", "")
-        
+        layout = self.compiled(theme)
+
         emb = discord.Embed(
-            title=f"📅 {data['date']} の定期連絡",
-            color=int(color_hex, 16)
+            title=layout.title.replace("{{ date }}", data['date']),
+            color=layout.color
         )
 
         # セクション1: インフォメーション
-        info_val = f"> **🌡️ 天気**： {data['weather']}\n> **💡 雑学**： {data['trivia']}"
-        emb.add_field(name=border, value=info_val, inline=False)
+        info_val = f"> **{layout.weather_label}**： {data['weather']}\n> **{layout.trivia_label}**： {data['trivia']}"
+        emb.add_field(name=layout.border, value=info_val, inline=False)
 
         # セクション2: 今日の予定（HTMLの構造をシミュレート）
         ev_lines = []
         for e in data['today_events']:
             st = e['start'].get('dateTime') or e['start'].get('date')
             time_str = datetime.fromisoformat(st.replace('Z', '+00:00')).astimezone(JST).strftime('%H:%M') if 'T' in st else " 終日 "
-            
+
             summary = e.get('summary', '無題')
             emoji = "🔹"
             for k, info in genres_config.items():
                 if info["tag"] in summary:
                     emoji = info["emoji"]; break
             ev_lines.append(f"{time_str} ┃ {emoji} {summary}")
-        
+
         schedule_md = "```md\n" + ("\n".join(ev_lines) if ev_lines else "✨ 予定なし") + "\n```"
-        emb.add_field(name="▽ 今日の予定", value=schedule_md, inline=False)
+        emb.add_field(name=layout.schedule_label, value=schedule_md, inline=False)
 
         # セクション3: 週間予定
         weekly_lines = []
@@ -64,11 +170,11 @@ class HTMLLayoutEngine:
             d_dt = datetime.strptime(d_raw, '%Y-%m-%d')
             mark = "┗" if i == len(data['future_events'][:5]) - 1 else "┣"
             weekly_lines.append(f"{mark} {d_dt.strftime('%m/%d')}: {e.get('summary')}")
-        
+
         weekly_md = "```\n" + ("\n".join(weekly_lines) if weekly_lines else "予定なし") + "\n```"
-        emb.add_field(name="▽ 今週の予定", value=weekly_md, inline=False)
+        emb.add_field(name=layout.weekly_label, value=weekly_md, inline=False)
 
-        emb.set_footer(text="by Utool")
+        emb.set_footer(text=layout.footer)
         return emb
 
-layout_engine = HTMLLayoutEngine()
\ No newline at end of file
+layout_engine = HTMLLayoutEngine()
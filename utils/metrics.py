@@ -0,0 +1,128 @@
+import bisect
+import threading
+
+# 秒単位のヒストグラムの既定の区切り
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    Prometheus のテキスト形式で出せる最小限のメトリクス置き場。
+    ヒストグラム・カウンター・ゲージは observe/inc/set で直接更新し、
+    既存の stats dict などは collector（呼ぶたびに値を返す関数）として登録する。
+    Flask のスレッドから読まれるので、更新と書き出しはロックで守る。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._histograms = {}  # name -> {labels(tuple): _Histogram}
+        self._values = {}      # name -> {labels(tuple): 値}
+        self._buckets = {}
+        self._collectors = []
+
+    def _declare(self, name, kind, help_text):
+        if name not in self._types:
+            self._types[name] = kind
+            self._help[name] = help_text
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            self._declare(name, "histogram", help_text)
+            self._buckets[name] = tuple(buckets)
+            self._histograms.setdefault(name, {})
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = _Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+                self._declare(name, "histogram", name)
+            h.observe(value)
+
+    def inc(self, name, amount=1, help_text=None, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._declare(name, "counter", help_text or name)
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, help_text=None, **labels):
+        with self._lock:
+            self._declare(name, "gauge", help_text or name)
+            self._values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def collector(self, fn):
+        """fn() が [(名前, 種類, 説明, [(ラベル dict, 値), ...]), ...] を返すよう登録する"""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in self._histograms.items():
+                if not series: continue
+                header(name, "histogram", self._help[name])
+                for key, h in series.items():
+                    labels = dict(key)
+                    total = 0
+                    for bound, n in zip(h.buckets, h.counts):
+                        total += n
+                        lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {total}")
+                    total += h.counts[-1]
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {total}")
+                    lines.append(f"{name}_sum{_labels(labels)} {h.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {total}")
+            for name, series in self._values.items():
+                header(name, self._types[name], self._help[name])
+                for key, v in series.items():
+                    lines.append(f"{name}{_labels(dict(key))} {v}")
+
+        for fn in list(self._collectors):
+            try:
+                families = fn()
+            except Exception as e:
+                # 他スレッドから読むので、途中で dict が変わったなどのときはその回だけ飛ばす
+                lines.append(f"# collector {getattr(fn, '__name__', fn)} failed: {type(e).__name__}")
+                continue
+            for name, kind, help_text, samples in families:
+                header(name, kind, help_text)
+                for labels, v in samples:
+                    lines.append(f"{name}{_labels(labels)} {v}")
+        return "\n".join(lines) + "\n"
+
+
+def hit_rate(hits, misses):
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+metrics = Metrics()
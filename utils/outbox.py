@@ -0,0 +1,218 @@
+import asyncio
+import itertools
+import os
+import random
+import time
+
+import aiohttp
+import discord
+
+# 優先度（小さいほど先に送る）
+PRIORITY_URGENT = 0   # 開始前通知
+PRIORITY_NORMAL = 1   # 定期連絡・コマンドの結果など
+PRIORITY_BULK = 2     # データ保存・バックアップ
+
+PRIORITY_NAMES = {PRIORITY_URGENT: "urgent", PRIORITY_NORMAL: "normal", PRIORITY_BULK: "bulk"}
+
+
+class TokenBucket:
+    """rate 個/秒で補充され、最大 capacity 個までためられるトークンバケット"""
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """トークンを1つ予約し、使えるようになるまでの待ち秒数を返す"""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait_time(self):
+        """トークンを使わずに、1つ使えるようになるまでの秒数を返す"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "channel_id", "priority", "seq", "future", "enqueued", "attempts")
+
+    def __init__(self, fn, args, kwargs, channel_id, priority, seq, future):
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+        self.channel_id, self.priority, self.seq, self.future = channel_id, priority, seq, future
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+
+class Outbox:
+    """
+    Discord への送信をまとめる優先度付きキュー。
+    チャンネルごと・全体のトークンバケットで送信ペースを抑え、失敗はジッター付きで再試行する。
+    チャンネルの枠が空いていない送信と再試行はワーカーを手放して後回しにし、その時刻にキューへ積み直す。
+    キューが一杯のときは送信側が空くまで待つ（上限付きのバックプレッシャー）。
+    """
+    def __init__(self, global_rate=None, channel_rate=None, channel_burst=None, max_queue=None, workers=4, max_retries=3):
+        self.global_rate = global_rate or float(os.getenv("OUTBOX_GLOBAL_RATE", "40"))
+        self.channel_rate = channel_rate or float(os.getenv("OUTBOX_CHANNEL_RATE", "1"))
+        self.channel_burst = channel_burst or int(os.getenv("OUTBOX_CHANNEL_BURST", "5"))
+        self.max_queue = max_queue or int(os.getenv("OUTBOX_MAX_QUEUE", "1000"))
+        self.workers = workers
+        self.max_retries = max_retries
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+        self._channels = {}
+        self._queue = None
+        self._tasks = []
+        self._seq = itertools.count()
+        # 後回しにした送信 -> 積み直しのタイマー（または積み直し待ちのタスク）
+        self._delayed = {}
+        # ワーカーが実行中の送信
+        self._running = set()
+        self.stats = {"sent": 0, "retries": 0, "failed": 0}
+        # 優先度ごとの待ち時間（キュー投入から送信開始まで）
+        self.wait_stats = {p: {"count": 0, "total": 0.0, "max": 0.0} for p in PRIORITY_NAMES}
+
+    @property
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def _bucket(self, channel_id):
+        if channel_id not in self._channels:
+            self._channels[channel_id] = TokenBucket(self.channel_rate, self.channel_burst)
+        return self._channels[channel_id]
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(self.max_queue)
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def submit(self, fn, *args, channel_id=None, priority=PRIORITY_NORMAL, **kwargs):
+        """fn(*args, **kwargs) をキュー経由で実行し、その結果を返す"""
+        self._ensure_workers()
+        job = _Job(fn, args, kwargs, channel_id, priority, next(self._seq), asyncio.get_running_loop().create_future())
+        await self._queue.put((priority, job.seq, job))
+        return await job.future
+
+    async def send(self, channel, priority=PRIORITY_NORMAL, **kwargs):
+        return await self.submit(channel.send, channel_id=channel.id, priority=priority, **kwargs)
+
+    async def react(self, message, emoji, priority=PRIORITY_NORMAL):
+        return await self.submit(message.add_reaction, emoji, channel_id=message.channel.id, priority=priority)
+
+    async def _worker(self):
+        while True:
+            priority, seq, job = await self._queue.get()
+            self._running.add(job)
+            try:
+                await self._run(job)
+            finally:
+                self._running.discard(job)
+                self._queue.task_done()
+
+    async def _run(self, job):
+        if job.future.done(): return
+        if job.channel_id:
+            wait = self._bucket(job.channel_id).wait_time()
+            if wait > 0:
+                # チャンネルの枠が空くまで待つ間、他のチャンネルへの送信を止めないようワーカーを手放す
+                self._defer(job, wait)
+                return
+            self._bucket(job.channel_id).reserve()
+        # 全体の枠はどの送信にも共通なので、ここで待つ
+        wait = self._global.reserve()
+        if wait > 0: await asyncio.sleep(wait)
+        if job.attempts == 0: self._record_wait(job)
+        job.attempts += 1
+        try:
+            result = await job.fn(*job.args, **job.kwargs)
+        except Exception as e:
+            if job.attempts <= self.max_retries and self._retryable(e):
+                self.stats["retries"] += 1
+                # 再試行は少しずらしてから同じ優先度で積み直す
+                delay = min(30, 2 ** job.attempts) * (0.5 + random.random())
+                self._defer(job, delay)
+                return
+            self.stats["failed"] += 1
+            if not job.future.done(): job.future.set_exception(e)
+            return
+        self.stats["sent"] += 1
+        if not job.future.done(): job.future.set_result(result)
+
+    def _defer(self, job, delay):
+        self._delayed[job] = asyncio.get_running_loop().call_later(delay, self._requeue, job)
+
+    def _requeue(self, job):
+        # 元の順番のまま積み直す（同じチャンネルへの送信の順序が入れ替わらないように）
+        item = (job.priority, job.seq, job)
+        try:
+            self._queue.put_nowait(item)
+            self._delayed.pop(job, None)
+        except asyncio.QueueFull:
+            async def put():
+                await self._queue.put(item)
+                self._delayed.pop(job, None)
+            self._delayed[job] = asyncio.create_task(put())
+
+    @staticmethod
+    def _retryable(e):
+        if isinstance(e, discord.HTTPException):
+            return e.status == 429 or e.status >= 500
+        # 接続できなかった（リクエストが届いていない）ときだけ送り直す。
+        # タイムアウトや通信中の切断は送信済みかもしれないので、重複しないよう再試行しない
+        return isinstance(e, aiohttp.ClientConnectorError)
+
+    def _record_wait(self, job):
+        waited = time.monotonic() - job.enqueued
+        s = self.wait_stats.setdefault(job.priority, {"count": 0, "total": 0.0, "max": 0.0})
+        s["count"] += 1
+        s["total"] += waited
+        s["max"] = max(s["max"], waited)
+
+    def summary(self):
+        waits = ", ".join(
+            f"{PRIORITY_NAMES.get(p, p)} 平均 {s['total'] / s['count']:.2f}s/最大 {s['max']:.2f}s"
+            for p, s in sorted(self.wait_stats.items()) if s["count"])
+        return f"待ち {self.depth} 件, 送信 {self.stats['sent']}, 再試行 {self.stats['retries']}, 失敗 {self.stats['failed']}" + (f" ({waits})" if waits else "")
+
+    async def _drain(self):
+        while True:
+            await self._queue.join()
+            if not self._delayed: return
+            # 後回しにした送信が積み直されるのを待つ
+            await asyncio.sleep(0.05)
+
+    async def close(self, timeout=10):
+        """
+        残っている送信（後回しにしたものも含む）をできるだけ流してからワーカーを止める。
+        流しきれなかった送信は失敗として返し、待っている呼び出し元が止まったままにならないようにする
+        """
+        if self._queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ 送信キューに {self.depth + len(self._delayed)} 件残したまま終了します")
+        for t in self._tasks: t.cancel()
+        self._tasks = []
+        if self._queue is None: return
+        pending = list(self._delayed) + list(self._running)
+        for handle in self._delayed.values(): handle.cancel()
+        self._delayed.clear()
+        self._running.clear()
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait()[2])
+            self._queue.task_done()
+        for job in pending:
+            if not job.future.done():
+                self.stats["failed"] += 1
+                job.future.set_exception(RuntimeError("送信キューを閉じたため送信できませんでした"))
+
+
+outbox = Outbox()
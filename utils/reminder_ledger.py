@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 5000
+
+
+class ReminderLedger:
+    """
+    送信済み通知の記録。キーは (カレンダーID, イベントID, 開始時刻, ギルドID, オフセット)。
+    開始時刻を過ぎたエントリは期限切れとして捨て、件数は max_entries を超えないように古い順に追い出す。
+    開始時刻をキーに含めるので、予定が移動した場合は新しい時刻で改めて通知される。
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> 期限 (UNIX 秒)
+        self.stats = {"evicted": 0, "expired": 0}
+
+    @staticmethod
+    def key(job):
+        return (job.cid, job.event['id'], job.event.get('start', {}).get('dateTime'), job.gid, job.offset)
+
+    def __contains__(self, key):
+        expires = self._entries.get(key)
+        if expires is None: return False
+        if expires <= self.clock():
+            del self._entries[key]
+            self.stats["expired"] += 1
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, expires):
+        self._entries[key] = expires
+        self._entries.move_to_end(key)
+        self._purge_front()
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def _purge_front(self):
+        # 挿入順はほぼ開始時刻順なので、先頭から期限切れを捨てれば償却 O(1)
+        now = self.clock()
+        while self._entries:
+            key, expires = next(iter(self._entries.items()))
+            if expires > now: break
+            self._entries.popitem(last=False)
+            self.stats["expired"] += 1
+
+    def purge(self):
+        now = self.clock()
+        for key in [k for k, exp in self._entries.items() if exp <= now]:
+            del self._entries[key]
+            self.stats["expired"] += 1
+
+    # --- DataManager への保存・復元 ---
+    def to_list(self):
+        self.purge()
+        return [list(key) + [expires] for key, expires in self._entries.items()]
+
+    def load(self, rows):
+        self._entries.clear()
+        for row in rows or []:
+            *key, expires = row
+            self._entries[tuple(key)] = expires
+        self.purge()
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
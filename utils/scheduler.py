@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import re
+import time
+
+from utils.event_cache import event_start
+
+DEFAULT_OFFSETS = [10]  # 分
+# 設定できる最大のオフセット（分）。予定の取得期間がこの分だけ延びるので上限を設ける
+MAX_OFFSET = 7 * 1440
+# 期限がこの秒数より先の通知はまだ積まない（定期的な resync で拾う）
+DEFAULT_HORIZON = 2 * 24 * 3600
+# 時計のずれを吸収するため、どれだけ先の期限でもこの秒数ごとに起きて確認する
+MAX_SLEEP = 300
+# 期限を過ぎてから見つかった通知を送ってよい最大の遅れ（秒）
+LATE_GRACE = 600
+# 同じ期限の通知を同時に送る数の上限（共有カレンダーで多数のギルドが同じ時刻に通知するとき用）
+FIRE_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "10"))
+
+
+def parse_offsets(text):
+    """'1d,1h,10m' や '60 10' を分単位のリストに変換する（単位なしは分）"""
+    units = {"d": 1440, "h": 60, "m": 1, "": 1}
+    offsets = []
+    for token in re.split(r"[,\s、]+", text.strip().lower()):
+        if not token: continue
+        m = re.fullmatch(r"(\d+)\s*([dhm]?)", token)
+        if not m: raise ValueError(f"オフセット形式エラー: {token}")
+        offsets.append(int(m.group(1)) * units[m.group(2)])
+    if not offsets: raise ValueError("オフセットが空です")
+    if max(offsets) > MAX_OFFSET: raise ValueError(f"オフセットは {format_offset(MAX_OFFSET)} までです")
+    return sorted(set(offsets), reverse=True)
+
+
+def format_offset(minutes):
+    return f"{format_duration(minutes)}前"
+
+
+def format_duration(minutes):
+    """分を「1日」「2時間」「1時間30分」のように表す"""
+    if minutes % 1440 == 0: return f"{minutes // 1440}日"
+    if minutes >= 60:
+        return f"{minutes // 60}時間" + (f"{minutes % 60}分" if minutes % 60 else "")
+    return f"{minutes}分"
+
+
+class ReminderJob:
+    __slots__ = ("gid", "cid", "event", "offset", "deadline", "start")
+
+    def __init__(self, gid, cid, event, offset, deadline, start):
+        self.gid, self.cid, self.event = gid, cid, event
+        self.offset, self.deadline, self.start = offset, deadline, start
+
+    @property
+    def key(self):
+        return (self.gid, self.cid, self.event['id'], self.offset)
+
+
+class ReminderScheduler:
+    """
+    (ギルド, カレンダー, イベント, オフセット) ごとの通知期限をヒープで保持し、次の期限まで眠る。
+    イベントの追加・移動・削除はキャッシュからの通知で該当イベントの期限だけを差し替える。
+    """
+    def __init__(self, fire, horizon=DEFAULT_HORIZON, clock=time.time):
+        self.fire = fire          # async fire(job)
+        self.horizon = horizon
+        self.clock = clock
+        self._heap = []           # (deadline, seq, key)
+        self._jobs = {}           # key -> (seq, job)
+        self._by_event = {}       # (cid, event_id) -> {key, ...}
+        self._subscribers = {}    # cid -> [gid, ...]
+        self._offsets = {}        # gid -> [分, ...]
+        self._seq = itertools.count()
+        self._wake = None
+        self._sem = None
+        self._tasks = set()       # 送信中の通知
+        self.stats = {"scheduled": 0, "fired": 0, "late": 0}
+
+    def _event(self):
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        return self._wake
+
+    def __len__(self):
+        return len(self._jobs)
+
+    # --- 購読情報 ---
+    def set_subscriptions(self, subscribers, offsets):
+        """subscribers: {cid: [gid]}, offsets: {gid: [分]}"""
+        self._subscribers = {cid: list(gids) for cid, gids in subscribers.items()}
+        self._offsets = dict(offsets)
+
+    def window_days(self):
+        """
+        sync_guild に渡すイベントの期間（日）。期限が horizon 以内に来る予定は、
+        最大のオフセットの分だけ horizon より先に始まるものまで含まれる
+        """
+        longest = max((max(offs, default=0) for offs in self._offsets.values()), default=max(DEFAULT_OFFSETS))
+        return math.ceil((self.horizon + longest * 60) / 86400)
+
+    # --- 期限の登録・取り消し ---
+    def schedule_event(self, gid, cid, event, offsets=None):
+        """イベント1件分の期限を差し替える（既存の期限は取り消す）"""
+        self.cancel_event(cid, event['id'], gid)
+        st = event.get('start', {}).get('dateTime')
+        if not st or event.get('status') == 'cancelled': return
+        start = event_start(event).timestamp()
+        now = self.clock()
+        for off in offsets or self._offsets.get(gid, DEFAULT_OFFSETS):
+            deadline = start - off * 60
+            # 開始済み・まだ遠すぎる・期限を大きく過ぎたものは積まない
+            if start <= now or deadline - now > self.horizon: continue
+            if now - deadline > min(off * 60, LATE_GRACE): continue
+            self._push(ReminderJob(gid, cid, event, off, deadline, start))
+
+    def _push(self, job):
+        seq = next(self._seq)
+        key = job.key
+        self._jobs[key] = (seq, job)
+        self._by_event.setdefault((job.cid, job.event['id']), set()).add(key)
+        heapq.heappush(self._heap, (job.deadline, seq, key))
+        self.stats["scheduled"] += 1
+        # 先頭が変わったかもしれないので眠っている run() を起こす
+        self._event().set()
+
+    def cancel_event(self, cid, event_id, gid=None):
+        keys = self._by_event.get((cid, event_id))
+        if not keys: return
+        for key in [k for k in keys if gid is None or k[0] == gid]:
+            # ヒープからは取り出し時に読み捨てる（遅延削除）
+            self._jobs.pop(key, None)
+            keys.discard(key)
+        if not keys: self._by_event.pop((cid, event_id), None)
+
+    def cancel_guild(self, gid):
+        for cid, eid in list(self._by_event):
+            self.cancel_event(cid, eid, gid)
+
+    def sync_guild(self, gid, events_by_cid, offsets=None):
+        """ギルドの期限をまとめて作り直す（購読や通知タイミングが変わったとき用）"""
+        self.cancel_guild(gid)
+        for cid, evs in events_by_cid.items():
+            for e in evs:
+                self.schedule_event(gid, cid, e, offsets)
+
+    def on_event_changed(self, cid, event, removed=False):
+        """キャッシュからの変更通知：購読中の全ギルドについてそのイベントだけ更新する"""
+        if removed:
+            self.cancel_event(cid, event['id'])
+            return
+        for gid in self._subscribers.get(cid, []):
+            self.schedule_event(gid, cid, event)
+
+    # --- 実行 ---
+    def next_deadline(self):
+        while self._heap:
+            deadline, seq, key = self._heap[0]
+            cur = self._jobs.get(key)
+            if cur and cur[0] == seq: return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self):
+        now = self.clock()
+        due = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now: break
+            _, seq, key = heapq.heappop(self._heap)
+            _, job = self._jobs.pop(key)
+            keys = self._by_event.get((job.cid, job.event['id']))
+            if keys:
+                keys.discard(key)
+                if not keys: self._by_event.pop((job.cid, job.event['id']), None)
+            if job.start <= now: continue
+            if now - deadline > 60: self.stats["late"] += 1
+            due.append(job)
+        return due
+
+    async def _fire(self, job):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(FIRE_CONCURRENCY)
+        async with self._sem:
+            try:
+                await self.fire(job)
+            except Exception as e:
+                print(f"❌ 通知送信エラー: {e}")
+
+    async def run(self):
+        wake = self._event()
+        while True:
+            wake.clear()
+            # 期限の来た通知は並行に送る（前の送信が終わるのを待たない）
+            for job in self.pop_due():
+                self.stats["fired"] += 1
+                task = asyncio.create_task(self._fire(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            deadline = self.next_deadline()
+            timeout = MAX_SLEEP if deadline is None else min(MAX_SLEEP, max(0, deadline - self.clock()))
+            try:
+                await asyncio.wait_for(wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
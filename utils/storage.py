@@ -0,0 +1,559 @@
+import discord
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.attendance_store import AttendanceBook
+from utils.outbox import outbox, PRIORITY_BULK
+
+SNAPSHOT_FILE = "data.json"  # 旧形式（非圧縮）
+SNAPSHOT_GZ_FILE = "data.json.gz"
+# ギルドごとの出欠記録（シャード）のファイル名
+SHARD_FILE = "shard_{}.json.gz"
+# 1メッセージに添付できるファイル数の上限
+MAX_ATTACHMENTS = 10
+MANIFEST_PREFIX = "utool-manifest "
+JOURNAL_FILE = "journal.jsonl"
+# ジャーナルがこの件数・セグメント数を超えたら全体スナップショットを書いて圧縮する
+JOURNAL_SNAPSHOT_EVERY = int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "500"))
+JOURNAL_MAX_SEGMENTS = int(os.getenv("JOURNAL_MAX_SEGMENTS", "20"))
+# 起動時に遡るメッセージ数（スナップショット + その後のジャーナル）
+HISTORY_LIMIT = JOURNAL_MAX_SEGMENTS * 3
+# SQLite から出欠を書き出すときに一度に読む行数
+EXPORT_CHUNK = 1000
+
+
+def _encode(obj):
+    # AttendanceBook などの独自型は to_json() の結果で保存する
+    if hasattr(obj, "to_json"): return obj.to_json()
+    raise TypeError(f"{type(obj).__name__} は JSON にできません")
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_encode)
+
+
+class StorageBackend:
+    """DataManager の保存先。スナップショット（全体）とジャーナル（差分）の読み書きを担当する"""
+    supports_queries = False
+    # ジャーナルの書き込みだけで出欠記録も保存済みになるか（False ならスナップショットまでシャードは未保存）
+    journal_covers_shards = False
+    # 直前の書き込みで送った（書いた）バイト数
+    last_write_bytes = 0
+
+    async def load(self):
+        """(スナップショットの dict または None, その後のジャーナルのリスト) を返す"""
+        raise NotImplementedError
+
+    async def write_snapshot(self, data, dirty=None, load_shard=None):
+        """
+        全体を書き込む。ギルドの出欠記録（シャード）は dirty に含まれるギルドと、まだ持っていないギルドの分だけ書き直す
+        （dirty が None なら全部）。メモリにないシャードは load_shard(gid) で読んで使う
+        """
+        raise NotImplementedError
+
+    async def append_journal(self, entries, data):
+        """entries を書き込む。data は反映済みの最新状態（必要な部分だけ参照する）"""
+        raise NotImplementedError
+
+    def load_shard(self, guild_id):
+        """ギルドの出欠記録（AttendanceBook）を同期で読む。保存されていなければ None"""
+        return None
+
+    async def fetch_shard(self, guild_id):
+        """load_shard() をワーカースレッドで実行する（ボタンやコマンドの処理中にイベントループを止めない）"""
+        return await asyncio.to_thread(self.load_shard, guild_id)
+
+    def should_compact(self, pending):
+        """次の書き込みを全体スナップショットにすべきか"""
+        return False
+
+
+class SnapshotCache:
+    """内容の SHA-256 をキーにしたローカルのスナップショット置き場（再起動時のダウンロードを省く）"""
+    def __init__(self, directory, keep=3):
+        self.directory = directory
+        self.keep = keep  # None なら件数では消さない（retain() で参照されているものだけ残す）
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.json.gz")
+
+    def get(self, digest):
+        path = self._path(digest)
+        if not os.path.exists(path): return None
+        with open(path, "rb") as f:
+            blob = f.read()
+        # 壊れたファイルは使わない
+        return blob if hashlib.sha256(blob).hexdigest() == digest else None
+
+    def put(self, digest, blob):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path(digest) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        # 書きかけのファイルが見えないよう、書き終えてから名前を付け替える
+        os.replace(tmp, self._path(digest))
+        self._prune()
+
+    def retain(self, digests):
+        """digests に含まれないファイルを消す"""
+        if not os.path.isdir(self.directory): return
+        for n in os.listdir(self.directory):
+            if n.endswith(".json.gz") and n[:-len(".json.gz")] not in digests:
+                try: os.remove(os.path.join(self.directory, n))
+                except OSError: pass
+
+    def _prune(self):
+        if self.keep is None: return
+        files = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".json.gz")]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files[self.keep:]:
+            try: os.remove(path)
+            except OSError: pass
+
+
+class ChannelStore(StorageBackend):
+    """
+    Discord のデータ用チャンネルに添付ファイルとして保存する。
+    スナップショットは gzip 圧縮し、ピン留めしたマニフェストメッセージが最新のスナップショットと
+    その後のジャーナルのメッセージIDを指す。起動時はマニフェストだけを読み、内容が変わっていなければローカルキャッシュを使う。
+    出欠記録はギルドごとのシャードファイルに分け、変更のあったギルドの分だけ送り直す。
+    スナップショット本体はギルド設定とシャードの置き場所（メッセージID・ファイル名・ハッシュ）の一覧だけを持つ。
+    """
+    def __init__(self, bot, channel_id, cache_dir=None):
+        self.bot = bot
+        self.channel_id = channel_id
+        cache_dir = cache_dir or os.getenv("DATA_CACHE_DIR", ".data_cache")
+        self.cache = SnapshotCache(cache_dir)
+        # シャードはハッシュで引くので件数では消さず、一覧から外れたものだけ消す
+        self.shards = SnapshotCache(os.path.join(cache_dir, "shards"), keep=None)
+        self._shard_index = {}  # gid -> [メッセージID, ファイル名, sha256]（出欠記録が空のギルドは None）
+        self._manifest_msg = None
+        # ピン留めされたマニフェストを探したか（バックアップ先として load() せずに書くときも既存のものを書き換える）
+        self._manifest_checked = False
+        self._manifest = {"v": 1, "snapshot": None, "journal": []}
+        self._since_snapshot = 0
+        # 旧形式から読み込んだときは、最初の書き込みをスナップショットにしてマニフェストを作る
+        self._needs_manifest = False
+        self.timings = {}
+
+    def _channel(self):
+        if not self.channel_id: return None
+        return self.bot.get_channel(self.channel_id)
+
+    # --- マニフェスト ---
+    async def _find_manifest(self, channel):
+        for msg in await channel.pins():
+            if msg.author == self.bot.user and msg.content.startswith(MANIFEST_PREFIX):
+                try:
+                    return msg, json.loads(msg.content[len(MANIFEST_PREFIX):])
+                except ValueError:
+                    continue
+        return None, None
+
+    async def _save_manifest(self, channel):
+        content = MANIFEST_PREFIX + _dumps(self._manifest)
+        if self._manifest_msg is None and not self._manifest_checked:
+            self._manifest_checked = True
+            self._manifest_msg, _ = await self._find_manifest(channel)
+        if self._manifest_msg:
+            try:
+                await outbox.submit(self._manifest_msg.edit, content=content, channel_id=channel.id, priority=PRIORITY_BULK)
+                return
+            except discord.NotFound:
+                self._manifest_msg = None
+        self._manifest_msg = await outbox.submit(channel.send, content, channel_id=channel.id, priority=PRIORITY_BULK)
+        try: await outbox.submit(self._manifest_msg.pin, channel_id=channel.id, priority=PRIORITY_BULK)
+        except discord.HTTPException as e: print(f"❌ マニフェストのピン留めに失敗: {e}")
+
+    # --- 読み込み ---
+    async def load(self):
+        self.timings = {}
+        channel = self._channel()
+        if not channel: return None, []
+        t = time.perf_counter()
+        msg, manifest = await self._find_manifest(channel)
+        self._manifest_checked = True
+        self.timings["manifest"] = time.perf_counter() - t
+        if manifest is None:
+            # マニフェストがない（旧形式）場合は履歴を遡って探す
+            return await self._load_from_history(channel)
+        self._manifest_msg, self._manifest = msg, manifest
+
+        data = None
+        if manifest.get("snapshot"):
+            msg_id, digest = manifest["snapshot"]
+            t = time.perf_counter()
+            blob = self.cache.get(digest)
+            self.timings["cache_hit"] = blob is not None
+            if blob is None:
+                att = self._find_attachment(await channel.fetch_message(msg_id), SNAPSHOT_GZ_FILE)
+                blob = await att.read()
+                if hashlib.sha256(blob).hexdigest() != digest:
+                    raise ValueError("スナップショットのハッシュが一致しません")
+                self.cache.put(digest, blob)
+            self.timings["download"] = time.perf_counter() - t
+            t = time.perf_counter()
+            data = json.loads(gzip.decompress(blob).decode("utf-8"))
+            self.timings["parse"] = time.perf_counter() - t
+            data = await self._unpack(channel, data)
+
+        t = time.perf_counter()
+        entries = []
+        for msg_id in manifest.get("journal", []):
+            att = self._find_attachment(await channel.fetch_message(msg_id), JOURNAL_FILE)
+            entries.extend(self._parse_journal(await att.read()))
+        self.timings["journal"] = time.perf_counter() - t
+        self._since_snapshot = len(entries)
+        return data, entries
+
+    async def _load_from_history(self, channel):
+        t = time.perf_counter()
+        segments = []
+        snapshot = None
+        async for msg in channel.history(limit=HISTORY_LIMIT):
+            names = {att.filename: att for att in msg.attachments}
+            if SNAPSHOT_GZ_FILE in names or SNAPSHOT_FILE in names:
+                snapshot = names.get(SNAPSHOT_GZ_FILE) or names[SNAPSHOT_FILE]
+                break
+            if JOURNAL_FILE in names:
+                segments.append(names[JOURNAL_FILE])
+        data = None
+        if snapshot:
+            blob = await snapshot.read()
+            if snapshot.filename == SNAPSHOT_GZ_FILE: blob = gzip.decompress(blob)
+            data = await self._unpack(channel, json.loads(blob.decode("utf-8")))
+        entries = []
+        # 履歴は新しい順なので、古いセグメントから並べる
+        for att in reversed(segments):
+            entries.extend(self._parse_journal(await att.read()))
+        self.timings["history_scan"] = time.perf_counter() - t
+        self._since_snapshot = len(entries)
+        self._needs_manifest = data is not None or bool(entries)
+        return data, entries
+
+    async def _unpack(self, channel, data):
+        """
+        シャード形式（v2）のスナップショットならギルド設定を取り出し、シャードの一覧だけを覚える。
+        シャードの中身はギルドが初めて使われたときに fetch_shard() で取ってくる
+        """
+        if not isinstance(data, dict) or data.get("v") != 2: return data
+        data, self._shard_index = data["guilds"], data["shards"]
+        self.shards.retain(self._shard_digests())
+        return data
+
+    def _shard_digests(self):
+        return {entry[2] for entry in self._shard_index.values() if entry}
+
+    async def _download_shard(self, entry):
+        """ローカルにないシャードをメッセージから取ってきてディスクに置く"""
+        msg_id, filename, digest = entry
+        t = time.perf_counter()
+        channel = self._channel()
+        if not channel: raise RuntimeError(f"シャード {filename} を取得できません（チャンネルがありません）")
+        blob = await self._find_attachment(await channel.fetch_message(msg_id), filename).read()
+        if hashlib.sha256(blob).hexdigest() != digest:
+            raise ValueError(f"シャード {filename} のハッシュが一致しません")
+        await asyncio.to_thread(self.shards.put, digest, blob)
+        self.timings["shards"] = self.timings.get("shards", 0) + time.perf_counter() - t
+
+    def load_shard(self, guild_id):
+        """ローカルにあるシャードを読む（なければ fetch_shard() で取ってくる必要がある）"""
+        entry = self._shard_index.get(str(guild_id))
+        if not entry: return None
+        blob = self.shards.get(entry[2])
+        if blob is None:
+            raise RuntimeError(f"シャード {entry[1]} がローカルにありません")
+        return AttendanceBook.from_json(json.loads(gzip.decompress(blob).decode("utf-8")))
+
+    async def fetch_shard(self, guild_id):
+        """ローカルにない（消えた）シャードはインデックスのメッセージから取り直してから読む"""
+        entry = self._shard_index.get(str(guild_id))
+        if not entry: return None
+        if not os.path.exists(self.shards._path(entry[2])):
+            await self._download_shard(entry)
+        try:
+            return await asyncio.to_thread(self.load_shard, guild_id)
+        except RuntimeError:
+            # 読む直前に消えた・壊れていた場合はもう一度だけ取り直す
+            await self._download_shard(entry)
+            return await asyncio.to_thread(self.load_shard, guild_id)
+
+    @staticmethod
+    def _find_attachment(msg, filename):
+        for att in msg.attachments:
+            if att.filename == filename: return att
+        raise ValueError(f"{filename} が見つかりません (message {msg.id})")
+
+    @staticmethod
+    def _parse_journal(blob):
+        return [json.loads(line) for line in blob.decode("utf-8").splitlines() if line.strip()]
+
+    # --- 書き込み ---
+    async def _upload(self, channel, blob, filename):
+        # 送信後に discord.File は閉じられるので、再試行のたびに作り直す
+        return await outbox.submit(
+            lambda: channel.send(file=discord.File(io.BytesIO(blob), filename=filename)),
+            channel_id=channel.id, priority=PRIORITY_BULK)
+
+    def should_compact(self, pending):
+        return (self._needs_manifest
+                or self._since_snapshot + pending >= JOURNAL_SNAPSHOT_EVERY
+                or len(self._manifest["journal"]) >= JOURNAL_MAX_SEGMENTS)
+
+    async def _shard_blobs(self, data, dirty, load_shard):
+        """
+        書き直すシャードを (gid, ファイル名, gzip 済みの中身, sha256) にする。
+        メモリにないシャードは先に load_shard（コルーチン関数でもよい）で読み、そのあとは await せずに全部作る
+        """
+        gids = [gid for gid in data if not gid.startswith("_")
+                and (dirty is None or gid in dirty or gid not in self._shard_index)]
+        loaded = {}
+        if load_shard:
+            for gid in gids:
+                if data.get(gid, {}).get("attendance") is not None: continue
+                book = load_shard(gid)
+                loaded[gid] = await book if asyncio.iscoroutine(book) else book
+        blobs = []
+        for gid in gids:
+            if gid not in data: continue
+            book = data[gid].get("attendance")
+            if book is None:
+                if gid not in loaded: continue
+                book = loaded[gid]
+            if not book:
+                # 空のギルドもインデックスに載せて、次のスナップショットで読み直さないようにする
+                self._shard_index[gid] = None
+                continue
+            blob = gzip.compress(_dumps(book).encode("utf-8"), compresslevel=6)
+            blobs.append((gid, SHARD_FILE.format(gid), blob, hashlib.sha256(blob).hexdigest()))
+        return blobs
+
+    async def _upload_shards(self, channel, blobs):
+        for i in range(0, len(blobs), MAX_ATTACHMENTS):
+            batch = blobs[i:i + MAX_ATTACHMENTS]
+            msg = await outbox.submit(
+                lambda: channel.send(files=[discord.File(io.BytesIO(blob), filename=name) for _, name, blob, _ in batch]),
+                channel_id=channel.id, priority=PRIORITY_BULK)
+            for gid, name, blob, digest in batch:
+                self.shards.put(digest, blob)
+                self._shard_index[gid] = [msg.id, name, digest]
+
+    async def write_snapshot(self, data, dirty=None, load_shard=None):
+        channel = self._channel()
+        if not channel: return
+        blobs = await self._shard_blobs(data, dirty, load_shard)
+        # ギルド設定も await の前に文字列にしておく（送信中に self.data が変わっても混ざらない）
+        guilds = _dumps({gid: ({k: v for k, v in gd.items() if k != "attendance"} if not gid.startswith("_") else gd)
+                         for gid, gd in data.items()})
+        await self._upload_shards(channel, blobs)
+        body = f'{{"v":2,"guilds":{guilds},"shards":{_dumps(self._shard_index)}}}'
+        blob = gzip.compress(body.encode("utf-8"), compresslevel=6)
+        self.last_write_bytes = len(blob) + sum(len(b) for _, _, b, _ in blobs)
+        digest = hashlib.sha256(blob).hexdigest()
+        msg = await self._upload(channel, blob, SNAPSHOT_GZ_FILE)
+        self.cache.put(digest, blob)
+        self._manifest = {"v": 1, "snapshot": [msg.id, digest], "journal": []}
+        self._since_snapshot = 0
+        self._needs_manifest = False
+        await self._save_manifest(channel)
+        self.shards.retain(self._shard_digests())
+
+    async def append_journal(self, entries, data):
+        """前回の書き込み以降の変更だけを1行1件で送る"""
+        channel = self._channel()
+        if not channel or not entries: return
+        body = "\n".join(_dumps(e) for e in entries).encode("utf-8")
+        self.last_write_bytes = len(body)
+        msg = await self._upload(channel, body, JOURNAL_FILE)
+        self._manifest["journal"].append(msg.id)
+        self._since_snapshot += len(entries)
+        await self._save_manifest(channel)
+
+
+class SQLiteStore(StorageBackend):
+    """
+    ローカルの SQLite に保存する。出欠・カレンダー購読はインデックス付きのテーブルで持ち、
+    ジャーナル1件がそのまま1行の更新になる。出欠記録は起動時には読まず、ギルドが使われたときに load_shard() で読む。
+    """
+    supports_queries = True
+    journal_covers_shards = True
+    # テーブルで持つキー（それ以外のギルド設定は guild_config に JSON で入れる）
+    TABLE_KEYS = ("calendar_ids", "attendance")
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS guild_config (
+            guild_id TEXT PRIMARY KEY,
+            config TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS calendar_subscriptions (
+            guild_id TEXT NOT NULL,
+            calendar_id TEXT NOT NULL,
+            PRIMARY KEY (guild_id, calendar_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_calendar_subscriptions_calendar ON calendar_subscriptions (calendar_id);
+        CREATE TABLE IF NOT EXISTS attendance (
+            guild_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            PRIMARY KEY (guild_id, date, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_attendance_user ON attendance (guild_id, user_id, date);
+        CREATE TABLE IF NOT EXISTS system (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS reminded (
+            key TEXT PRIMARY KEY,
+            expires REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    async def _run(self, fn):
+        """SQLite の処理をワーカースレッドで1つずつ実行する"""
+        def job():
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    return fn(conn)
+        return await asyncio.to_thread(job)
+
+    def _config_of(self, gd):
+        return _dumps({k: v for k, v in gd.items() if k not in self.TABLE_KEYS})
+
+    async def load(self):
+        def read(conn):
+            data = {}
+            for gid, config in conn.execute("SELECT guild_id, config FROM guild_config"):
+                data[gid] = json.loads(config)
+                data[gid]["calendar_ids"] = []
+            for gid, cid in conn.execute("SELECT guild_id, calendar_id FROM calendar_subscriptions ORDER BY rowid"):
+                data.setdefault(gid, {}).setdefault("calendar_ids", []).append(cid)
+            for (gid,) in conn.execute("SELECT DISTINCT guild_id FROM attendance"):
+                data.setdefault(gid, {})
+            system = {name: json.loads(value) for name, value in conn.execute("SELECT name, value FROM system")}
+            # 送信済み通知は1件1行（期限切れは読まない）
+            reminded = [json.loads(key) + [expires] for key, expires in
+                        conn.execute("SELECT key, expires FROM reminded WHERE expires > ? ORDER BY rowid", (time.time(),))]
+            if reminded: system["reminded"] = system.get("reminded", []) + reminded
+            if system: data["_system"] = system
+            return data or None
+        return await self._run(read), []
+
+    def load_shard(self, guild_id):
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT date, user_id, name, status FROM attendance WHERE guild_id = ? ORDER BY date, rowid", (str(guild_id),)).fetchall()
+        book = AttendanceBook()
+        for row in rows: book.set(*row)
+        return book
+
+    async def write_snapshot(self, data, dirty=None, load_shard=None):
+        # スレッドに渡す前に行へ変換しておく（書き込み中に self.data が変わっても影響しない）
+        # 出欠はメモリに読み込まれているギルドの分だけ書き直す（それ以外の行はそのまま残す）
+        configs, subs, rows, system, reminded, shard_gids = [], [], [], [], [], []
+        for gid, gd in data.items():
+            if gid == "_system":
+                system = [(name, _dumps(v)) for name, v in gd.items() if name != "reminded"]
+                reminded = [(_dumps(r[:-1]), r[-1]) for r in gd.get("reminded", [])]
+                continue
+            configs.append((gid, self._config_of(gd)))
+            subs.extend((gid, cid) for cid in gd.get("calendar_ids", []))
+            if gd.get("attendance") is not None:
+                shard_gids.append((gid,))
+                rows.extend((gid, *r) for r in AttendanceBook.from_json(gd["attendance"]).rows())
+
+        self.last_write_bytes = (sum(len(c) for _, c in configs) + sum(len(v) for _, v in system)
+                                 + sum(len(d) + len(u) + len(n) + len(st) for _, d, u, n, st in rows))
+
+        def write(conn):
+            for table in ("guild_config", "calendar_subscriptions", "system", "reminded"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.executemany("DELETE FROM attendance WHERE guild_id = ?", shard_gids)
+            conn.executemany("INSERT INTO guild_config VALUES (?, ?)", configs)
+            conn.executemany("INSERT OR IGNORE INTO calendar_subscriptions VALUES (?, ?)", subs)
+            conn.executemany("INSERT OR REPLACE INTO attendance VALUES (?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO system VALUES (?, ?)", system)
+            conn.executemany("INSERT OR REPLACE INTO reminded VALUES (?, ?)", reminded)
+        await self._run(write)
+
+    async def append_journal(self, entries, data):
+        stmts, configs = [], {}
+        for op, gid, *args in entries:
+            if op == "att":
+                stmts.append(("INSERT OR REPLACE INTO attendance VALUES (?, ?, ?, ?, ?)", (gid, *args)))
+            elif op == "cal+":
+                stmts.append(("INSERT OR IGNORE INTO calendar_subscriptions VALUES (?, ?)", (gid, args[0])))
+            elif op == "sys":
+                stmts.append(("INSERT OR REPLACE INTO system VALUES (?, ?)", (args[0], _dumps(args[1]))))
+            elif op == "remind":
+                stmts.append(("INSERT OR REPLACE INTO reminded VALUES (?, ?)", (_dumps(args[0]), args[1])))
+            if gid is not None and gid in data:
+                # 設定系の操作はそのギルドの設定行だけを書き直す
+                configs[gid] = self._config_of(data[gid])
+
+        if any(e[0] == "remind" for e in entries):
+            # 開始時刻を過ぎた送信済み通知はもう要らない
+            stmts.append(("DELETE FROM reminded WHERE expires <= ?", (time.time(),)))
+        self.last_write_bytes = len(_dumps(entries))
+
+        def write(conn):
+            for sql, params in stmts:
+                conn.execute(sql, params)
+            conn.executemany("INSERT OR REPLACE INTO guild_config VALUES (?, ?)", list(configs.items()))
+        await self._run(write)
+
+    @staticmethod
+    def _attendance_sql(guild_id, since=None, until=None):
+        sql = "SELECT date, user_id, name, status FROM attendance WHERE guild_id = ?"
+        params = [guild_id]
+        if since:
+            sql += " AND date >= ?"
+            params.append(since)
+        if until:
+            sql += " AND date <= ?"
+            params.append(until)
+        return sql + " ORDER BY date, rowid", params
+
+    async def query_attendance(self, guild_id, date_str=None, since=None, until=None):
+        """(日付, ユーザーID, 名前, ステータス) を日付順に返す"""
+        if date_str: since = until = date_str
+        sql, params = self._attendance_sql(guild_id, since, until)
+        return await self._run(lambda conn: conn.execute(sql, params).fetchall())
+
+    def stream_attendance(self, guild_id, since=None, until=None, chunk=EXPORT_CHUNK):
+        """
+        query_attendance() と同じ行を chunk 行ずつ読みながら返すジェネレーター（書き出し用）。
+        読み出す側のスレッドで専用の接続を開くので、共有の接続やロックを長く占有しない
+        """
+        sql, params = self._attendance_sql(guild_id, since, until)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            cur = conn.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk)
+                if not rows: return
+                yield from rows
+        finally:
+            conn.close()
@@ -0,0 +1,114 @@
+import csv
+import os
+import time
+import zlib
+from datetime import date
+
+# 雑学ファイルのパス（A列: "3/31" 形式の日付, B列: 雑学）
+TRIVIA_FILE = "trivia.csv"
+# ギルドごとに追加できる雑学パック（<パック名>.csv）の置き場所
+PACK_DIR = os.getenv("TRIVIA_PACK_DIR", "trivia_packs")
+# ファイルの更新確認（stat）をこの秒数より頻繁には行わない
+CHECK_INTERVAL = 60
+
+# 索引をそのまま使えた回数と、ファイルを読み直した回数
+trivia_stats = {"hits": 0, "reloads": 0}
+
+
+def _date_key(text):
+    """'03/05' や ' 3/5' を '3/5' にそろえる"""
+    m, d = text.strip().split("/")
+    return f"{int(m)}/{int(d)}"
+
+
+class _TriviaFile:
+    """1つの CSV を日付キーの索引にしたもの（更新時刻が変わったときだけ読み直す）"""
+    def __init__(self, path, validate=False):
+        self.path = path
+        self.validate = validate
+        self.mtime = None
+        self.index = {}
+        self.checked_at = None
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < CHECK_INTERVAL:
+            trivia_stats["hits"] += 1
+            return self.index
+        self.checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self.mtime, self.index = None, {}
+            return self.index
+        if mtime != self.mtime:
+            trivia_stats["reloads"] += 1
+            self.index = self._parse()
+            self.mtime = mtime
+        else:
+            trivia_stats["hits"] += 1
+        return self.index
+
+    def _parse(self):
+        index = {}
+        try:
+            # エンコーディングは、Excelで作ったCSVなら 'utf-8-sig' か 'cp932' が一般的です
+            with open(self.path, "r", encoding="utf-8-sig") as f:
+                for row in csv.reader(f):
+                    if len(row) < 2 or not row[1].strip(): continue
+                    try:
+                        index.setdefault(_date_key(row[0]), []).append(row[1])
+                    except ValueError:
+                        continue
+        except Exception as e:
+            print(f"❌ 雑学ファイル読み込みエラー ({self.path}): {e}")
+            return index
+        missing = self.missing_days(index) if self.validate else []
+        if missing:
+            head = ", ".join(missing[:10]) + (" ..." if len(missing) > 10 else "")
+            print(f"⚠️ {self.path}: {len(missing)} 日分の雑学がありません ({head})")
+        return index
+
+    @staticmethod
+    def missing_days(index):
+        """うるう年を含む 366 日のうち、雑学のない日付"""
+        missing = []
+        for ordinal in range(date(2024, 1, 1).toordinal(), date(2024, 12, 31).toordinal() + 1):
+            d = date.fromordinal(ordinal)
+            if f"{d.month}/{d.day}" not in index:
+                missing.append(f"{d.month}/{d.day}")
+        return missing
+
+
+class TriviaStore:
+    """trivia.csv と追加パックを日付キーで引く。1日に複数の候補があればパックの組み合わせと年で決まった順に回す"""
+    def __init__(self, path=TRIVIA_FILE, pack_dir=PACK_DIR):
+        self.base = _TriviaFile(path, validate=True)
+        self.pack_dir = pack_dir
+        self._packs = {}
+
+    def available_packs(self):
+        if not os.path.isdir(self.pack_dir): return []
+        return sorted(n[:-4] for n in os.listdir(self.pack_dir) if n.endswith(".csv"))
+
+    def _pack(self, name):
+        if name not in self._packs:
+            self._packs[name] = _TriviaFile(os.path.join(self.pack_dir, f"{name}.csv"))
+        return self._packs[name]
+
+    def candidates(self, day, packs=()):
+        key = f"{day.month}/{day.day}"
+        items = list(self.base.refresh().get(key, []))
+        for name in packs:
+            items.extend(self._pack(name).refresh().get(key, []))
+        return items
+
+    def get_trivia(self, day, packs=()):
+        items = self.candidates(day, packs)
+        if not items: return None
+        # 同じ日・同じパック構成なら毎回同じものを選び（定期連絡をまとめて作れるように）、年ごとに次の候補へ進める
+        seed = zlib.crc32(",".join(packs).encode())
+        return items[(day.year + seed) % len(items)]
+
+
+trivia_store = TriviaStore()
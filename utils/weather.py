@@ -0,0 +1,101 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+
+WEATHER_CODES = {
+    0: "☀️快晴", 1: "🌤️晴れ", 2: "⛅くもり", 3: "☁️曇り",
+    45: "🌫️霧", 48: "🌫️霧", 51: "🚿小雨", 53: "🚿小雨", 55: "🚿小雨",
+    61: "☔雨", 63: "☔雨", 65: "☔激しい雨", 71: "❄️雪", 73: "❄️雪", 75: "❄️激しい雪",
+    80: "🌦️にわか雨", 81: "🌦️にわか雨", 82: "🌦️激しいにわか雨", 95: "⚡雷雨"
+}
+
+# 地点が設定されていないギルドは宮崎市の天気を使う
+DEFAULT_LOCATION = {"name": "宮崎市", "lat": 31.9111, "lon": 131.4239}
+
+
+class WeatherService:
+    """
+    Open-Meteo の日別予報を地点ごとに TTL 付きでキャッシュする。
+    同じ地点への同時リクエストは1回の通信にまとめ、API が落ちているときは古い予報を返す。
+    """
+    def __init__(self, base_url=None, ttl=None, timeout=5, max_connections=8):
+        self.base_url = base_url or os.getenv("WEATHER_API_URL", "https://api.open-meteo.com/v1/forecast")
+        self.ttl = ttl if ttl is not None else float(os.getenv("WEATHER_TTL", "1800"))
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._cache = {}     # (lat, lon) -> (取得時刻, 予報)
+        self._inflight = {}  # (lat, lon) -> Future
+        self._session = None
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "stale": 0, "errors": 0}
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_connections))
+        return self._session
+
+    @staticmethod
+    def _key(location):
+        return (round(float(location["lat"]), 4), round(float(location["lon"]), 4))
+
+    async def get_forecast(self, location=None):
+        """{'YYYY-MM-DD': '☀️快晴 (20℃/10℃)', ...} を返す。取得できなければ空の dict"""
+        key = self._key(location or DEFAULT_LOCATION)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            self.stats["hits"] += 1
+            return cached[1]
+
+        fut = self._inflight.get(key)
+        if fut is None:
+            self.stats["misses"] += 1
+            fut = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        try:
+            # 呼び出し元がキャンセルされても他の待ち手のための通信は続ける
+            return await asyncio.shield(fut)
+        except Exception as e:
+            self.stats["errors"] += 1
+            if cached:
+                self.stats["stale"] += 1
+                return cached[1]
+            print(f"❌ 天気取得エラー: {e}")
+            return {}
+
+    async def _fetch(self, key):
+        lat, lon = key
+        params = {
+            "latitude": lat, "longitude": lon,
+            "daily": "weathercode,temperature_2m_max,temperature_2m_min",
+            "timezone": "Asia/Tokyo",
+        }
+        async with self._get_session().get(self.base_url, params=params) as resp:
+            resp.raise_for_status()
+            r = await resp.json()
+        forecast = {}
+        for i, d in enumerate(r['daily']['time']):
+            code = r['daily']['weathercode'][i]
+            w_text = WEATHER_CODES.get(code, "❓")
+            t_max = r['daily']['temperature_2m_max'][i]
+            t_min = r['daily']['temperature_2m_min'][i]
+            forecast[d] = f"{w_text} ({t_max}℃/{t_min}℃)"
+        self._cache[key] = (time.monotonic(), forecast)
+        return forecast
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+weather_service = WeatherService()
+
+
+def guild_location(guild_data):
+    """ギルド設定の地点（未設定なら既定地点）"""
+    return guild_data.get("weather_location") or DEFAULT_LOCATION